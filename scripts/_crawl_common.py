@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Helpers shared by the crawl_pdfs*.py scripts: link extraction, URL filters, robots.txt cache."""
+import functools, html, json, re, time
+import urllib.error, urllib.request
+import urllib.robotparser as robotparser
+from pathlib import Path
+from urllib.parse import urljoin, urldefrag
+from lxml import etree, html as lxml_html
+
+# --- HTML link extraction -----------------------------------------------------
+# lxml (libxml2) instead of the pure-Python html.parser; body bytes are decoded in C
+_HREFS = etree.XPath("//a/@href", smart_strings=False)
+_CHARSET = re.compile(r"""charset\s*=\s*["']?([\w.:-]+)""", re.I)
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.I)
+
+# fast path: quoted hrefs that end in .pdf, matched on the raw bytes (no decode, no tree)
+_HREF_PDF = re.compile(rb"""href\s*=\s*["']([^"'<>]+?\.pdf(?:\?[^"'<>]*)?)["']""", re.I)
+
+def header_charset(content_type: str):
+    """charset= from a Content-Type header, or None."""
+    m = _CHARSET.search(content_type or "")
+    return m.group(1) if m else None
+
+@functools.lru_cache(maxsize=None)
+def _html_parser(encoding: str):
+    return lxml_html.HTMLParser(encoding=encoding)
+
+def extract_links(body: bytes, encoding: str = None) -> list:
+    # header charset, else <meta charset> in the first KiB (the HTML prescan window), else UTF-8
+    if not encoding:
+        m = _META_CHARSET.search(body, 0, 1024)
+        encoding = m.group(1).decode("ascii") if m else "utf-8"
+    try:
+        doc = lxml_html.fromstring(body, parser=_html_parser(encoding.lower()))
+    except LookupError:  # unknown charset name
+        return extract_links(body, "utf-8") if encoding.lower() != "utf-8" else []
+    except (etree.ParserError, ValueError):
+        return []
+    return [h for h in _HREFS(doc) if h]
+
+def extract_pdf_links(body: bytes) -> list:
+    return [html.unescape(m.group(1).decode("utf-8", errors="ignore")) for m in _HREF_PDF.finditer(body)]
+
+# --- URL filters --------------------------------------------------------------
+def host_filter(hosts):
+    # one compiled regex over the URL's authority instead of urlparse + a loop over hosts;
+    # accepts http(s) URLs on one of `hosts` or a subdomain of it
+    if not hosts:
+        return lambda u: False
+    alt = "|".join(re.escape(h.lower()) for h in sorted(hosts, key=len, reverse=True))
+    match = re.compile(rf"https?://(?:[^/?#@]*@)?(?:[^/?#@:]*\.)?(?:{alt})(?::\d*)?(?:[/?#]|$)", re.I).match
+    return lambda u: match(u) is not None
+
+def norm_url(base: str, href: str) -> str:
+    # absolutize + remove fragments
+    u, _frag = urldefrag(urljoin(base, href.strip()))
+    return u
+
+def looks_pdf(u: str) -> bool:
+    # ".pdf" at the end or right before the query string; plain str ops, no regex
+    lu = u.lower()
+    return lu.endswith(".pdf") or ".pdf?" in lu
+
+# --- robots.txt cache (TTL, persisted between runs) ---------------------------
+ROBOTS_TTL = 12 * 3600
+ROBOTS_CACHE_PATH = Path("data/audits/robots_cache.json")
+ROBOTS_MAX_BYTES = 500 * 1024   # robots.txt past 500 KiB is ignored (Google's limit)
+
+def fetch_robots(scheme: str, host: str, user_agent: str, timeout: float = 20) -> dict:
+    """Download robots.txt; the returned entry is what gets cached on disk."""
+    status, body = 200, ""
+    req = urllib.request.Request(f"{scheme}://{host}/robots.txt", headers={"User-Agent": user_agent})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as f:
+            body = f.read(ROBOTS_MAX_BYTES).decode("utf-8", errors="ignore")
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0  # unreachable
+    return {"fetched_at": time.time(), "status": status, "body": body}
+
+def persistable(entry: dict) -> bool:
+    # 5xx and network failures say nothing about the host's rules: deny for this run, refetch next run
+    return 0 < entry.get("status", 0) < 500
+
+def robots_parser(entry: dict) -> robotparser.RobotFileParser:
+    # same status handling as RobotFileParser.read(): 401/403 deny, other 4xx allow,
+    # 5xx/unreachable leave the parser unread (can_fetch is False)
+    rp = robotparser.RobotFileParser()
+    status = entry["status"]
+    if status in (401, 403):
+        rp.disallow_all = True
+    elif 400 <= status < 500:
+        rp.allow_all = True
+    elif 0 < status < 400:
+        rp.parse(entry["body"].splitlines())
+    return rp
+
+class RobotsCache:
+    def __init__(self, user_agent: str, timeout: float = 20, path: Path = ROBOTS_CACHE_PATH):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.path = path
+        self.entries = {}   # host -> {"fetched_at", "status", "body"}
+        self.parsers = {}   # host -> RobotFileParser
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            data = {}
+        for host, entry in data.items():
+            if persistable(entry) and self.is_fresh(entry):
+                self.put(host, entry)
+
+    @staticmethod
+    def is_fresh(entry: dict) -> bool:
+        return time.time() - entry.get("fetched_at", 0) < ROBOTS_TTL
+
+    def fetch(self, scheme: str, host: str) -> dict:
+        return fetch_robots(scheme, host, self.user_agent, self.timeout)
+
+    def get(self, host: str):
+        entry = self.entries.get(host)
+        if entry is None or not self.is_fresh(entry):
+            return None
+        return self.parsers[host]
+
+    def put(self, host: str, entry: dict) -> robotparser.RobotFileParser:
+        self.entries[host] = entry
+        self.parsers[host] = robots_parser(entry)
+        return self.parsers[host]
+
+    def parser_for(self, scheme: str, host: str) -> robotparser.RobotFileParser:
+        return self.get(host) or self.put(host, self.fetch(scheme, host))
+
+    def save(self):
+        # 5xx and network failures are retried next run instead of being persisted
+        keep = {h: e for h, e in self.entries.items() if persistable(e)}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(keep), encoding="utf-8")
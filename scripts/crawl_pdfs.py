@@ -1,164 +1,293 @@
 #!/usr/bin/env python3
-import asyncio, aiohttp, async_timeout, re, os, json, hashlib, time
-from urllib.parse import urljoin, urlparse, urldefrag
+import asyncio, aiohttp, aiofiles, contextlib, os, hashlib, pickle, signal, time
+import orjson
+from collections import deque
+from urllib.parse import urlparse
 from pathlib import Path
-import urllib.robotparser as robotparser
-from html.parser import HTMLParser
 import argparse
+from _crawl_common import RobotsCache, extract_links, header_charset, host_filter, looks_pdf, norm_url
+
+# optional: constant-size visited set; falls back to an exact set()
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:
+    ScalableBloomFilter = None
+
+# optional: libuv event loop (drop-in, less scheduler overhead); stdlib loop otherwise
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 ALLOWED_HOSTS = set()      # filled from args
 START_URLS = []            # seeds
 OUT_DIR = Path("data/raw")
 SESSION_TIMEOUT = 20
-CONCURRENCY = 8
+CONCURRENCY = 32           # max in-flight HTTP requests
+WORKERS = 64               # queue consumers (decoupled from CONCURRENCY)
 MAX_PAGES = 10000
 RATE_DELAY = 0.3           # politeness
+CHUNK = 1024 * 128         # PDF stream chunk
+HTML_MAX_BYTES = 8 * 1024 * 1024   # larger HTML bodies are skipped
 USER_AGENT = "ragchat-pdfcrawler/0.1"
+STATE_PATH = Path("data/audits/crawl_state.pkl")   # snapshot for --resume
 
-# --- HTML link extractor ------------------------------------------------------
-class LinkExtractor(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.links = []
-    def handle_starttag(self, tag, attrs):
-        if tag.lower() == "a":
-            href = dict(attrs).get("href")
-            if href:
-                self.links.append(href)
-
-def is_allowed_host(u: str) -> bool:
-    try:
-        h = urlparse(u).hostname or ""
-    except Exception:
-        return False
-    if h == "scnat.ch": return True
-    return any(h.endswith("." + ah) or h == ah for ah in ALLOWED_HOSTS)
+is_allowed_host = host_filter({"scnat.ch"})   # rebuilt from --allow in crawl()
+
+def url_to_id(u: str) -> str:
+    # non-cryptographic file id: 8-byte BLAKE2b (16 hex chars, same width as before)
+    return hashlib.blake2b(u.encode("utf-8"), digest_size=8).hexdigest()
 
-def norm_url(base, href):
-    # absolutize + remove fragments
-    u = urljoin(base, href)
-    u, _frag = urldefrag(u)
-    return u
+class InFlightLimiter:
+    """At most `limit` requests in flight across all workers; resizable at runtime."""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._cond = asyncio.Condition()
 
-def looks_pdf(u: str) -> bool:
-    return bool(re.search(r"\.pdf(\?|$)", u, re.I))
+    async def set_limit(self, limit: int):
+        async with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
 
-def url_to_id(u: str) -> str:
-    return hashlib.sha1(u.encode("utf-8")).hexdigest()[:16]
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+class HostRateLimiter:
+    """Politeness delay per host; slots are reserved up front and the sleep holds no lock."""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.next_ok = {}
+
+    async def acquire(self, host: str):
+        now = time.monotonic()
+        slot = max(now, self.next_ok.get(host, 0.0))
+        self.next_ok[host] = slot + self.delay
+        if slot > now:
+            await asyncio.sleep(slot - now)
 
-async def fetch(session, url):
+@contextlib.asynccontextmanager
+async def peek_headers(session, url):
+    # status + content type only; the body is left unread for the caller
+    async with session.get(url, headers={"User-Agent": USER_AGENT}) as resp:
+        yield resp.status, resp.headers.get("Content-Type","").lower(), resp
+
+async def stream_body(resp, path: Path) -> int:
+    size = 0
+    async with aiofiles.open(path, "wb") as f:
+        async for chunk in resp.content.iter_chunked(CHUNK):
+            await f.write(chunk)
+            size += len(chunk)
+    return size
+
+async def read_capped(resp, limit: int):
+    buf = bytearray()
+    async for chunk in resp.content.iter_chunked(CHUNK):
+        buf += chunk
+        if len(buf) > limit:
+            return None
+    return bytes(buf)
+
+async def fetch(session, url, pdf_path: Path):
+    # decided on headers alone: PDFs are streamed straight to pdf_path (body None), HTML is
+    # read up to HTML_MAX_BYTES, anything else is dropped unread (body b"")
+    streaming = False
     try:
-        with async_timeout.timeout(SESSION_TIMEOUT):
-            async with session.get(url, headers={"User-Agent": USER_AGENT}) as resp:
-                ct = resp.headers.get("Content-Type","").lower()
-                b = await resp.read()
-                return resp.status, ct, b
+        async with peek_headers(session, url) as (status, ct, resp):
+            if status != 200:
+                return status, ct, b""
+            if "application/pdf" in ct or looks_pdf(url):
+                streaming = True
+                await stream_body(resp, pdf_path)
+                return status, ct, None
+            if "text/html" not in ct:
+                return status, ct, b""
+            if int(resp.headers.get("Content-Length") or 0) > HTML_MAX_BYTES:
+                return None, ct, b""
+            body = await read_capped(resp, HTML_MAX_BYTES)
+            if body is None:
+                return None, ct, b""
+            return status, ct, body
     except Exception:
+        if streaming:
+            pdf_path.unlink(missing_ok=True)
         return None, "", b""
 
+# --- crawl state snapshot (seen, discovered PDFs, pending frontier) -----------
+def save_state(seen, discovered_pdf, frontier):
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_PATH.with_suffix(".tmp")
+    tmp.write_bytes(pickle.dumps({"seen": seen, "discovered_pdf": discovered_pdf, "frontier": frontier}))
+    tmp.replace(STATE_PATH)
+
+def load_state():
+    try:
+        return pickle.loads(STATE_PATH.read_bytes())
+    except Exception:
+        return None
+
 async def crawl(args):
-    global ALLOWED_HOSTS, START_URLS
+    global ALLOWED_HOSTS, START_URLS, is_allowed_host
     ALLOWED_HOSTS = set(args.allow)
+    is_allowed_host = host_filter({"scnat.ch", *ALLOWED_HOSTS})
     START_URLS = args.seed
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
-    seen = set()
-    to_visit = asyncio.Queue()
-    for s in START_URLS:
-        await to_visit.put(s)
-
-    # robots per host
-    robots_cache = {}
-    def can_fetch(u: str) -> bool:
+    state = load_state() if args.resume else None
+    if state is not None:
+        seen, discovered_pdf, start = state["seen"], state["discovered_pdf"], state["frontier"]
+        print(f"Resuming: {len(seen)} URLs seen, {len(start)} pending")
+    else:
+        if ScalableBloomFilter is not None:
+            seen = ScalableBloomFilter(initial_capacity=100_000, error_rate=1e-4)
+        else:
+            seen = set()
+        discovered_pdf = set()
+        start = START_URLS
+    # bounded queue for backpressure; links that don't fit wait in `overflow`
+    # (workers are also the producers, so a blocking put() could deadlock them all)
+    to_visit = asyncio.Queue(maxsize=8 * CONCURRENCY)
+    overflow = deque()
+    def enqueue(u: str):
+        try:
+            to_visit.put_nowait(u)
+        except asyncio.QueueFull:
+            overflow.append(u)
+    def refill():
+        while overflow and not to_visit.full():
+            to_visit.put_nowait(overflow.popleft())
+    def frontier():
+        return list(to_visit._queue) + list(overflow)   # asyncio.Queue has no public snapshot
+    for s in start:
+        enqueue(s)
+
+    # robots per host: known hosts are fetched up front (in parallel, off the event loop);
+    # other subdomains are fetched once on first sight, concurrent callers share that fetch
+    robots = RobotsCache(USER_AGENT, SESSION_TIMEOUT)
+    robots_pending = {}
+    async def load_robots(scheme: str, host: str):
+        if host not in robots_pending:
+            loop = asyncio.get_running_loop()
+            robots_pending[host] = loop.run_in_executor(None, robots.fetch, scheme, host)
+        try:
+            entry = await robots_pending[host]
+        finally:
+            robots_pending.pop(host, None)
+        return robots.get(host) or robots.put(host, entry)
+
+    async def prewarm_robots(hosts):
+        todo = [h for h in hosts if h and robots.get(h) is None]
+        await asyncio.gather(*(load_robots("https", h) for h in todo))
+
+    async def can_fetch(u: str) -> bool:
         try:
             pr = urlparse(u)
             host = pr.hostname or ""
             scheme = pr.scheme or "https"
         except Exception:
             return False
-        if host not in robots_cache:
-            rp = robotparser.RobotFileParser()
-            rp.set_url(f"{scheme}://{host}/robots.txt")
-            try:
-                rp.read()
-            except Exception:
-                pass
-            robots_cache[host] = rp
-        return robots_cache[host].can_fetch(USER_AGENT, u)
+        rp = robots.get(host) or await load_robots(scheme, host)
+        return rp.can_fetch(USER_AGENT, u)
 
-    sem = asyncio.Semaphore(CONCURRENCY)
+    in_flight = InFlightLimiter(CONCURRENCY)
+    rate = HostRateLimiter(RATE_DELAY)
     pdf_saved = 0
     html_visited = 0
-    discovered_pdf = set()
+    processed = 0
+    snapshot_every = max(MAX_PAGES // 20, 1)
 
-    async def worker():
-        nonlocal pdf_saved, html_visited
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SESSION_TIMEOUT)) as session:
-            while True:
-                try:
-                    u = await asyncio.wait_for(to_visit.get(), timeout=1.0)
-                except asyncio.TimeoutError:
-                    return
-                if u in seen:
-                    to_visit.task_done()
+    async def worker(session):
+        nonlocal pdf_saved, html_visited, processed
+        while True:
+            refill()
+            try:
+                u = await asyncio.wait_for(to_visit.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                if overflow:
                     continue
-                seen.add(u)
+                return
+            if u in seen:
+                to_visit.task_done()
+                continue
+            seen.add(u)
+            processed += 1
+            if processed % snapshot_every == 0:
+                save_state(seen, discovered_pdf, frontier())
 
-                if len(seen) > MAX_PAGES:
-                    to_visit.task_done()
-                    return
+            if len(seen) > MAX_PAGES:
+                to_visit.task_done()
+                return
 
-                if not is_allowed_host(u) or not can_fetch(u):
-                    to_visit.task_done()
-                    continue
+            if not is_allowed_host(u) or not await can_fetch(u):
+                to_visit.task_done()
+                continue
 
-                await asyncio.sleep(RATE_DELAY)
-                async with sem:
-                    status, ct, body = await fetch(session, u)
+            sid = url_to_id(u)
+            pdf_path = OUT_DIR / f"{sid}.pdf"
+            await rate.acquire(urlparse(u).hostname or "")
+            async with in_flight:
+                status, ct, body = await fetch(session, u, pdf_path)
 
-                if status != 200:
-                    to_visit.task_done()
-                    continue
+            if status != 200:
+                to_visit.task_done()
+                continue
 
-                # If it's a PDF, save it
-                if "application/pdf" in ct or looks_pdf(u):
-                    sid = url_to_id(u)
-                    pdf_path = OUT_DIR / f"{sid}.pdf"
-                    meta_path = OUT_DIR / f"{sid}.meta.json"
-                    try:
-                        pdf_path.write_bytes(body)
-                        meta = {"url": u, "content_type": "application/pdf", "saved_at": int(time.time())}
-                        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                        pdf_saved += 1
-                    except Exception:
-                        pass
-                    to_visit.task_done()
-                    continue
+            # If it's a PDF, it is already on disk; add the meta file
+            if "application/pdf" in ct or looks_pdf(u):
+                meta_path = OUT_DIR / f"{sid}.meta.json"
+                try:
+                    meta = {"url": u, "content_type": "application/pdf", "saved_at": int(time.time())}
+                    meta_path.write_bytes(orjson.dumps(meta))
+                    pdf_saved += 1
+                except Exception:
+                    pass
+                to_visit.task_done()
+                continue
 
-                # Otherwise if it's HTML, extract links
-                if "text/html" in ct:
-                    html_visited += 1
-                    try:
-                        text = body.decode("utf-8", errors="ignore")
-                        parser = LinkExtractor(); parser.feed(text)
-                        for href in parser.links:
-                            nu = norm_url(u, href)
-                            if not is_allowed_host(nu): 
-                                continue
-                            # enqueue HTML pages for discovery
-                            if nu not in seen and (nu.startswith("http://") or nu.startswith("https://")):
-                                # Always follow HTML; PDFs saved immediately when fetched
-                                await to_visit.put(nu)
-                            # Remember PDFs so we can print stats
-                            if looks_pdf(nu):
-                                discovered_pdf.add(nu)
-                    except Exception:
-                        pass
+            # Otherwise if it's HTML, extract links
+            if "text/html" in ct:
+                html_visited += 1
+                try:
+                    for href in extract_links(body, header_charset(ct)):
+                        nu = norm_url(u, href)
+                        if not is_allowed_host(nu): 
+                            continue
+                        # enqueue HTML pages for discovery
+                        if nu not in seen and (nu.startswith("http://") or nu.startswith("https://")):
+                            # Always follow HTML; PDFs saved immediately when fetched
+                            enqueue(nu)
+                        # Remember PDFs so we can print stats
+                        if looks_pdf(nu):
+                            discovered_pdf.add(nu)
+                except Exception:
+                    pass
 
-                to_visit.task_done()
+            to_visit.task_done()
 
-    workers = [asyncio.create_task(worker()) for _ in range(CONCURRENCY)]
-    await asyncio.gather(*workers, return_exceptions=True)
+    # SIGTERM cancels the crawl like Ctrl-C does, so the final snapshot below still runs
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    # one session (and keep-alive pool) shared by all workers
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY, limit_per_host=CONCURRENCY, ttl_dns_cache=300)
+    try:
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=SESSION_TIMEOUT),
+        ) as session:
+            await prewarm_robots({"scnat.ch", *ALLOWED_HOSTS, *(urlparse(s).hostname for s in START_URLS)})
+            workers = [asyncio.create_task(worker(session)) for _ in range(WORKERS)]
+            await asyncio.gather(*workers, return_exceptions=True)
+    finally:
+        save_state(seen, discovered_pdf, frontier())
+        robots.save()
 
     # write discovered list for transparency
     (Path("data/audits")).mkdir(parents=True, exist_ok=True)
@@ -177,6 +306,10 @@ if __name__ == "__main__":
     ap.add_argument("--seed", nargs="+", required=True, help="Seed URLs (space separated)")
     ap.add_argument("--allow", nargs="+", required=True, help="Allowed hostnames (scnat.ch, portal-cdn.scnat.ch, ...)")
     ap.add_argument("--max-pages", type=int, default=10000)
+    ap.add_argument("--resume", action="store_true", help=f"Continue from {STATE_PATH} (seen URLs + pending queue)")
     args = ap.parse_args()
     MAX_PAGES = args.max_pages
-    asyncio.run(crawl(args))
+    if uvloop is not None:
+        uvloop.run(crawl(args))
+    else:
+        asyncio.run(crawl(args))
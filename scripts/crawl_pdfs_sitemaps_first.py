@@ -9,23 +9,26 @@ SCNAT-only (scnat.ch + portal-cdn.scnat.ch). Respects robots.txt.
 """
 
 import argparse
-import concurrent.futures as cf
+import asyncio
 import hashlib
 import io
+import json
 import os
 import re
 import sys
 import time
 from dataclasses import dataclass
-from html.parser import HTMLParser
 from pathlib import Path
-from typing import Iterable, List, Set
+from typing import Iterable, List, Optional, Set
 from urllib.parse import urlparse, urldefrag
 
+import httpx
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from lxml import etree
 from tqdm import tqdm
-import urllib.robotparser as robotparser
+from _crawl_common import RobotsCache, extract_links, extract_pdf_links, header_charset, host_filter, looks_pdf, norm_url
 
 USER_AGENT = "ragchat-sitemap-pdf/0.2"
 OUT_DIR = Path("data/raw")
@@ -33,36 +36,34 @@ AUDIT_DIR = Path("data/audits")
 TIMEOUT = 20
 RETRIES = 3
 CHUNK = 1024 * 128  # 128KB
+BAR_STEP = 1024 * 1024  # bytes between updates of the aggregate bytes bar
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
 
 ALLOWED = {"scnat.ch", "portal-cdn.scnat.ch"}
 
-def is_allowed_host(u: str) -> bool:
-    try:
-        h = urlparse(u).hostname or ""
-    except Exception:
-        return False
-    return h in ALLOWED or any(h.endswith("." + d) for d in ALLOWED)
+# HTTP/2 for the download client only if the optional h2 package is installed
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+is_allowed_host = host_filter(ALLOWED)
 
 def normalize_url(u: str) -> str:
     u, _frag = urldefrag(u.strip())
     return u
 
-def looks_pdf(u: str) -> bool:
-    return bool(re.search(r"\.pdf(\?|$)", u, re.I))
-
 def sha16(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8")).hexdigest()[:16]
 
 # ---------------- robots + sitemaps ----------------
+ROBOTS = RobotsCache(USER_AGENT, TIMEOUT)
+
 def get_robots_sitemaps(host: str) -> List[str]:
-    rp = robotparser.RobotFileParser()
     base = f"https://{host}"
-    rp.set_url(f"{base}/robots.txt")
-    try:
-        rp.read()
-    except Exception:
-        pass
-    maps = rp.site_maps() or []
+    rp = ROBOTS.parser_for("https", host)
+    maps = list(rp.site_maps() or [])
     # Some sites forget to list sitemap in robots; try common locations
     common = [f"{base}/sitemap.xml", f"{base}/sitemap_index.xml"]
     for c in common:
@@ -70,10 +71,19 @@ def get_robots_sitemaps(host: str) -> List[str]:
             maps.append(c)
     return maps
 
+# one keep-alive session for sitemap + HTML discovery; pool sized in main()
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = USER_AGENT
+
+def configure_session(pool_size: int):
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    SESSION.mount("https://", adapter)
+    SESSION.mount("http://", adapter)
+
 def fetch(url: str, stream=False):
     for _ in range(RETRIES):
         try:
-            r = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=TIMEOUT, stream=stream, allow_redirects=True)
+            r = SESSION.get(url, timeout=TIMEOUT, stream=stream, allow_redirects=True)
             if r.status_code == 200:
                 return r
         except Exception:
@@ -81,20 +91,27 @@ def fetch(url: str, stream=False):
     return None
 
 def parse_sitemap(xml_bytes: bytes) -> List[str]:
-    # return urls listed (handles both urlset and sitemapindex)
+    # return urls listed (urlset and sitemapindex alike; nested maps end in .xml)
+    # streams <loc> nodes instead of building a full tree, so big indexes stay cheap
     urls = []
     try:
-        soup = BeautifulSoup(xml_bytes, "lxml-xml")
-    except Exception:
-        return urls
-    # urlset -> url -> loc
-    for loc in soup.select("urlset url loc"):
-        if loc.text:
-            urls.append(loc.text.strip())
-    # sitemapindex -> sitemap -> loc (nested)
-    for loc in soup.select("sitemapindex sitemap loc"):
-        if loc.text:
-            urls.append(loc.text.strip())
+        for _, loc in etree.iterparse(
+            io.BytesIO(xml_bytes),
+            tag=(f"{{{SITEMAP_NS}}}loc", "loc"),
+            recover=True,
+            resolve_entities=False,
+            no_network=True,
+        ):
+            if loc.text and loc.text.strip():
+                urls.append(loc.text.strip())
+            # drop finished <url>/<sitemap> entries as we go
+            entry = loc.getparent()
+            loc.clear()
+            if entry is not None:
+                while entry.getprevious() is not None:
+                    del entry.getparent()[0]
+    except etree.XMLSyntaxError:
+        pass
     return urls
 
 def gather_from_sitemaps(hosts: Iterable[str]) -> Set[str]:
@@ -133,16 +150,6 @@ def gather_from_sitemaps(hosts: Iterable[str]) -> Set[str]:
     return found
 
 # --------------- optional HTML scan for PDFs ---------------
-class LinkExtractor(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.links = []
-    def handle_starttag(self, tag, attrs):
-        if tag.lower() == "a":
-            href = dict(attrs).get("href")
-            if href:
-                self.links.append(href)
-
 def discover_pdfs_from_html(urls: List[str], max_pages: int = 2000) -> Set[str]:
     """Scan a capped set of HTML pages (from sitemaps) to find more PDFs."""
     found = set()
@@ -153,20 +160,13 @@ def discover_pdfs_from_html(urls: List[str], max_pages: int = 2000) -> Set[str]:
         r = fetch(u, stream=False)
         if not r or "text/html" not in (r.headers.get("Content-Type", "")).lower():
             continue
-        try:
-            text = r.content.decode("utf-8", errors="ignore")
-        except Exception:
-            continue
-        parser = LinkExtractor()
-        try:
-            parser.feed(text)
-        except Exception:
-            continue
         base = u
-        for href in parser.links:
+        # full parse only when the regex finds nothing (e.g. unquoted hrefs)
+        hrefs = extract_pdf_links(r.content) or extract_links(r.content, header_charset(r.headers.get("Content-Type", "")))
+        for href in hrefs:
             if not href or href.startswith("javascript:"):
                 continue
-            absu = normalize_url(requests.compat.urljoin(base, href))
+            absu = norm_url(base, href)
             if looks_pdf(absu) and is_allowed_host(absu):
                 found.add(absu)
     return found
@@ -192,7 +192,27 @@ def target_paths_for(url: str) -> (Path, Path):
     meta_path = OUT_DIR / f"{sid}.meta.json"
     return pdf_path, meta_path
 
-def save_meta(meta_path: Path, url: str, size: int):
+# content dedup: HEAD (ETag, Content-Length) -> PDF already saved under another URL
+DEDUP_PATH = AUDIT_DIR / "dedup.json"
+
+def load_dedup() -> dict:
+    try:
+        return json.loads(DEDUP_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def save_dedup(manifest: dict):
+    DEDUP_PATH.parent.mkdir(parents=True, exist_ok=True)
+    DEDUP_PATH.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+def dedup_key(headers) -> Optional[str]:
+    # an ETag is required: Content-Length alone would merge different PDFs of equal size
+    etag = headers.get("ETag")
+    if not etag:
+        return None
+    return f"{etag}|{headers.get('Content-Length', '')}"
+
+def save_meta(meta_path: Path, url: str, size: int, alias_of: Optional[Path] = None):
     meta = {
         "url": url,
         "content_type": "application/pdf",
@@ -200,60 +220,93 @@ def save_meta(meta_path: Path, url: str, size: int):
         "size": size,
         "source": "sitemaps_html"
     }
-    meta_path.write_text(
-        __import__("json").dumps(meta, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    if alias_of is not None:
+        meta["alias_of"] = str(alias_of)
+    meta_path.write_bytes(orjson.dumps(meta))
 
-def download_one(url: str) -> DownloadResult:
+async def download_one(client: httpx.AsyncClient, url: str, dedup: dict, bytes_bar: tqdm) -> DownloadResult:
     try:
         pdf_path, meta_path = target_paths_for(url)
         if pdf_path.exists() and pdf_path.stat().st_size > 0 and meta_path.exists():
             return DownloadResult(url, pdf_path, True, pdf_path.stat().st_size)
 
-        r = fetch(url, stream=True)
-        if not r:
-            return DownloadResult(url, pdf_path, False, 0)
-
-        ctype = (r.headers.get("Content-Type", "")).lower()
-        # trust extension + headers; some CDNs use octet-stream
-        if ("pdf" not in ctype) and (not looks_pdf(url)):
-            return DownloadResult(url, pdf_path, False, 0)
-
-        total = int(r.headers.get("Content-Length") or 0)
-        size = 0
-        OUT_DIR.mkdir(parents=True, exist_ok=True)
-
-        with open(pdf_path, "wb") as f, tqdm(
-            total=total if total > 0 else None,
-            unit="B",
-            unit_scale=True,
-            desc=os.path.basename(pdf_path),
-            leave=False,
-        ) as bar:
-            for chunk in r.iter_content(chunk_size=CHUNK):
-                if not chunk:
-                    continue
-                f.write(chunk)
-                size += len(chunk)
-                bar.update(len(chunk))
-
-        save_meta(meta_path, url, size)
-        return DownloadResult(url, pdf_path, True, size)
-    except KeyboardInterrupt:
-        raise
+        # same content already on disk under another URL (query-string variants etc.)?
+        key = None
+        try:
+            h = await client.head(url)
+            if h.status_code == 200:
+                key = dedup_key(h.headers)
+        except httpx.HTTPError:
+            pass
+        if key and key in dedup and Path(dedup[key]).exists():
+            save_meta(meta_path, url, 0, alias_of=Path(dedup[key]))
+            return DownloadResult(url, Path(dedup[key]), True, 0)
+
+        for _ in range(RETRIES):
+            try:
+                async with client.stream("GET", url) as r:
+                    if r.status_code != 200:
+                        continue
+
+                    ctype = (r.headers.get("Content-Type", "")).lower()
+                    # trust extension + headers; some CDNs use octet-stream
+                    if ("pdf" not in ctype) and (not looks_pdf(url)):
+                        return DownloadResult(url, pdf_path, False, 0)
+
+                    size = 0
+                    pending = 0  # bytes not yet reported to bytes_bar
+                    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+                    with open(pdf_path, "wb") as f:
+                        async for chunk in r.aiter_bytes(CHUNK):
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            size += len(chunk)
+                            pending += len(chunk)
+                            if pending >= BAR_STEP:
+                                bytes_bar.update(pending)
+                                pending = 0
+                    bytes_bar.update(pending)
+
+                save_meta(meta_path, url, size)
+                if key:
+                    dedup[key] = str(pdf_path)
+                return DownloadResult(url, pdf_path, True, size)
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+        return DownloadResult(url, pdf_path, False, 0)
     except Exception:
         return DownloadResult(url, Path(""), False, 0)
 
-def download_all(urls: List[str], max_workers: int = 6) -> List[DownloadResult]:
+async def download_all(urls: List[str], max_workers: int = 6) -> List[DownloadResult]:
+    """One keep-alive client for all downloads; max_workers bounds in-flight requests."""
     results: List[DownloadResult] = []
     urls = list(dict.fromkeys(urls))  # dedupe, keep order
-    with cf.ThreadPoolExecutor(max_workers=max_workers) as ex, tqdm(total=len(urls), desc="PDFs downloaded", unit="pdf") as pbar:
-        futs = {ex.submit(download_one, u): u for u in urls}
-        for fut in cf.as_completed(futs):
-            res = fut.result()
-            results.append(res)
-            pbar.update(1)
+    sem = asyncio.Semaphore(max_workers)
+    limits = httpx.Limits(max_connections=max_workers, max_keepalive_connections=max_workers)
+    dedup = load_dedup()
+
+    async with httpx.AsyncClient(
+        http2=HTTP2,
+        limits=limits,
+        timeout=TIMEOUT,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+    ) as client:
+        # one aggregate bytes bar instead of a bar per PDF
+        with tqdm(total=len(urls), desc="PDFs downloaded", unit="pdf") as pbar, \
+                tqdm(desc="Bytes downloaded", unit="B", unit_scale=True, position=1) as bytes_bar:
+            async def bounded(u: str):
+                async with sem:
+                    res = await download_one(client, u, dedup, bytes_bar)
+                results.append(res)
+                pbar.update(1)
+
+            try:
+                await asyncio.gather(*(bounded(u) for u in urls))
+            finally:
+                save_dedup(dedup)
     return results
 
 def main():
@@ -264,6 +317,7 @@ def main():
     parser.add_argument("--workers", type=int, default=6, help="Parallel downloads")
     args = parser.parse_args()
 
+    configure_session(args.workers)
     AUDIT_DIR.mkdir(parents=True, exist_ok=True)
 
     # 1) Discover PDFs via sitemaps
@@ -288,6 +342,8 @@ def main():
                         html_urls.append(u)
         extra_pdfs = discover_pdfs_from_html(html_urls, max_pages=args.html_cap)
 
+    ROBOTS.save()
+
     # Save audits
     (AUDIT_DIR / "pdf_from_sitemaps.txt").write_text("\n".join(sorted(pdf_from_sitemaps)), encoding="utf-8")
     (AUDIT_DIR / "pdf_from_html_scan.txt").write_text("\n".join(sorted(extra_pdfs)), encoding="utf-8")
@@ -313,7 +369,7 @@ def main():
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     print("\nStarting downloads…")
-    results = download_all(all_pdf_urls, max_workers=args.workers)
+    results = asyncio.run(download_all(all_pdf_urls, max_workers=args.workers))
 
     ok = sum(1 for r in results if r.ok)
     total_bytes = sum(r.size for r in results if r.ok)
@@ -1,47 +1,45 @@
 #!/usr/bin/env python3
-import time, re, os, json, hashlib, queue, argparse
-from urllib.parse import urljoin, urlparse, urldefrag
+import time, os, hashlib, queue, argparse
+from urllib.parse import urlparse
 from pathlib import Path
-import urllib.robotparser as robotparser
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from _crawl_common import RobotsCache, extract_links, header_charset, host_filter, looks_pdf, norm_url
 
 USER_AGENT = "ragchat-pdfcrawler-sync/0.1"
 RATE_DELAY = 0.3
 TIMEOUT = 20
 MAX_PAGES_DEFAULT = 10000
 
-def looks_pdf(u: str) -> bool:
-    return bool(re.search(r"\.pdf(\?|$)", u, re.I))
-
 def url_to_id(u: str) -> str:
     return hashlib.sha1(u.encode("utf-8")).hexdigest()[:16]
 
-def is_allowed_host(u: str, allowed_hosts: set) -> bool:
-    try:
-        h = urlparse(u).hostname or ""
-    except Exception:
-        return False
-    return h == "scnat.ch" or h in allowed_hosts or any(h.endswith(f".{ah}") for ah in allowed_hosts)
-
-def can_fetch(u: str, robots_cache: dict) -> bool:
+def can_fetch(u: str, robots: RobotsCache) -> bool:
     try:
         pr = urlparse(u); host = pr.hostname or ""; scheme = pr.scheme or "https"
     except Exception:
         return False
-    if host not in robots_cache:
-        rp = robotparser.RobotFileParser()
-        rp.set_url(f"{scheme}://{host}/robots.txt")
-        try:
-            rp.read()
-        except Exception:
-            pass
-        robots_cache[host] = rp
-    return robots_cache[host].can_fetch(USER_AGENT, u)
+    return robots.parser_for(scheme, host).can_fetch(USER_AGENT, u)
+
+class HostRateLimiter:
+    """Politeness delay per host: only sleeps for what is left of that host's delay."""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.next_ok = {}
+
+    def acquire(self, host: str):
+        wait = self.next_ok.get(host, 0.0) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.next_ok[host] = time.monotonic() + self.delay
+
+# one keep-alive session for the whole crawl instead of a new connection per URL
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = USER_AGENT
 
 def fetch(u: str):
     try:
-        r = requests.get(u, headers={"User-Agent": USER_AGENT}, timeout=TIMEOUT, allow_redirects=True)
+        r = SESSION.get(u, timeout=TIMEOUT, allow_redirects=True)
         return r.status_code, r.headers.get("Content-Type","").lower(), r.content
     except Exception:
         return None, "", b""
@@ -50,7 +48,9 @@ def crawl(seeds, allow_hosts, out_dir: Path, max_pages: int):
     out_dir.mkdir(parents=True, exist_ok=True)
     q = queue.Queue()
     seen = set()
-    robots_cache = {}
+    is_allowed_host = host_filter({"scnat.ch", *allow_hosts})
+    robots = RobotsCache(USER_AGENT, TIMEOUT)
+    rate = HostRateLimiter(RATE_DELAY)
     discovered_pdfs = set()
     html_visited = 0
     pdf_saved = 0
@@ -62,10 +62,10 @@ def crawl(seeds, allow_hosts, out_dir: Path, max_pages: int):
         if u in seen: continue
         seen.add(u)
 
-        if not is_allowed_host(u, allow_hosts): continue
-        if not can_fetch(u, robots_cache): continue
+        if not is_allowed_host(u): continue
+        if not can_fetch(u, robots): continue
 
-        time.sleep(RATE_DELAY)
+        rate.acquire(urlparse(u).hostname or "")
         status, ct, body = fetch(u)
         if status != 200: continue
 
@@ -77,7 +77,7 @@ def crawl(seeds, allow_hosts, out_dir: Path, max_pages: int):
             try:
                 pdf_path.write_bytes(body)
                 meta = {"url": u, "content_type": "application/pdf", "saved_at": int(time.time())}
-                meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+                meta_path.write_bytes(orjson.dumps(meta))
                 pdf_saved += 1
             except Exception:
                 pass
@@ -87,17 +87,14 @@ def crawl(seeds, allow_hosts, out_dir: Path, max_pages: int):
         if "text/html" in ct or ct.startswith("text/"):
             html_visited += 1
             try:
-                text = body.decode("utf-8", errors="ignore")
-                soup = BeautifulSoup(text, "html.parser")
-                for a in soup.find_all("a", href=True):
-                    href = a["href"].strip()
+                for href in extract_links(body, header_charset(ct)):
+                    href = href.strip()
                     if not href or href.startswith("javascript:") or href.startswith("mailto:"):
                         continue
-                    nu = urljoin(u, href)
-                    nu, _ = urldefrag(nu)
+                    nu = norm_url(u, href)
                     if not nu.startswith(("http://","https://")): 
                         continue
-                    if not is_allowed_host(nu, allow_hosts):
+                    if not is_allowed_host(nu):
                         continue
                     if looks_pdf(nu):
                         discovered_pdfs.add(nu)
@@ -106,6 +103,7 @@ def crawl(seeds, allow_hosts, out_dir: Path, max_pages: int):
             except Exception:
                 pass
 
+    robots.save()
     audits = Path("data/audits"); audits.mkdir(parents=True, exist_ok=True)
     (audits / "pdf_discovered_urls.txt").write_text("\n".join(sorted(discovered_pdfs)), encoding="utf-8")
 
@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import argparse, csv, re, sys, time
+import argparse, asyncio, csv, sys, time
 from pathlib import Path
 from urllib.parse import urljoin, urlparse, urldefrag
 
 from tqdm import tqdm
-from playwright.sync_api import sync_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, async_playwright
 
 IN_CSV = Path("data/audits/short_html_lt50.csv")
 OUT_DIR = Path("data/audits")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 ALLOWED = {"scnat.ch", "portal-cdn.scnat.ch"}  # SCNAT-only
+BLOCKED_RESOURCES = {"image", "media", "font", "stylesheet"}  # only the DOM is needed
 
 def is_allowed(u: str) -> bool:
     try:
@@ -26,7 +27,15 @@ def norm_abs(base: str, href: str) -> str:
     return u
 
 def looks_pdf(u: str) -> bool:
-    return bool(re.search(r"\.pdf(\?|$)", u, re.I))
+    # ".pdf" at the end or right before the query string; plain str ops, no regex
+    lu = u.lower()
+    return lu.endswith(".pdf") or ".pdf?" in lu
+
+async def _block_subresources(route):
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
 
 def read_short_urls(limit=None):
     urls = []
@@ -43,35 +52,55 @@ def read_short_urls(limit=None):
             seen.add(u); uniq.append(u)
     return uniq[:limit] if limit else uniq
 
-def discover(limit=None, timeout_ms=15000, network_idle_ms=2000, headless=True):
+async def discover(limit=None, timeout_ms=15000, network_idle_ms=2000, headless=True, concurrency=4):
     urls = read_short_urls(limit=limit)
     found = set()
     pairs = []  # (page_url, pdf_url)
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=headless)
-        ctx = browser.new_context(viewport={"width": 1366, "height": 900})
-        page = ctx.new_page()
-
-        for u in tqdm(urls, desc="Pages rendered", unit="page"):
-            try:
-                page.goto(u, timeout=timeout_ms, wait_until="domcontentloaded")
-                # wait a bit for network to settle
-                page.wait_for_timeout(network_idle_ms)
-                # collect anchor hrefs (JS-rendered DOM)
-                anchors = page.eval_on_selector_all("a", "els => els.map(e => e.getAttribute('href'))")
-                for href in anchors or []:
-                    if not href or href.startswith("javascript:"):
-                        continue
-                    au = norm_abs(u, href)
-                    if looks_pdf(au) and is_allowed(au):
-                        if au not in found:
-                            found.add(au)
-                            pairs.append((u, au))
-            except Exception:
-                continue
-
-        browser.close()
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+        sem = asyncio.Semaphore(concurrency)
+        bar = tqdm(total=len(urls), desc="Pages rendered", unit="page")
+
+        async def render_one(u):
+            async with sem:
+                ctx = None
+                try:
+                    # fresh context per page: isolated cookies/storage, cheap compared to a browser
+                    # small viewport keeps layout work down; links are in the DOM either way
+                    ctx = await browser.new_context(
+                        viewport={"width": 412, "height": 915},
+                        java_script_enabled=True,
+                        bypass_csp=True,
+                    )
+                    await ctx.route("**/*", _block_subresources)
+                    page = await ctx.new_page()
+                    await page.goto(u, timeout=timeout_ms, wait_until="domcontentloaded")
+                    # wait for the network to settle, but no longer than network_idle_ms
+                    try:
+                        await page.wait_for_load_state("networkidle", timeout=network_idle_ms)
+                    except PlaywrightTimeoutError:
+                        pass
+                    # collect anchor hrefs (JS-rendered DOM)
+                    anchors = await page.eval_on_selector_all("a", "els => els.map(e => e.getAttribute('href'))")
+                    for href in anchors or []:
+                        if not href or href.startswith("javascript:"):
+                            continue
+                        au = norm_abs(u, href)
+                        if looks_pdf(au) and is_allowed(au):
+                            if au not in found:
+                                found.add(au)
+                                pairs.append((u, au))
+                except Exception:
+                    pass
+                finally:
+                    if ctx is not None:
+                        await ctx.close()
+                    bar.update(1)
+
+        await asyncio.gather(*(render_one(u) for u in urls))
+        bar.close()
+        await browser.close()
 
     # write outputs
     (OUT_DIR / "pdf_from_headless.txt").write_text("\n".join(sorted(found)), encoding="utf-8")
@@ -89,13 +118,15 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--limit", type=int, default=0, help="Limit pages (0 = all)")
     ap.add_argument("--timeout", type=int, default=15000, help="Per-page navigation timeout (ms)")
-    ap.add_argument("--idle", type=int, default=2000, help="Extra wait after load (ms)")
+    ap.add_argument("--idle", type=int, default=2000, help="Max wait for network idle after load (ms)")
+    ap.add_argument("--concurrency", type=int, default=4, help="Pages rendered in parallel")
     ap.add_argument("--headed", action="store_true", help="Show browser UI (for debugging)")
     args = ap.parse_args()
-    discover(
+    asyncio.run(discover(
         limit=(args.limit or None),
         timeout_ms=args.timeout,
         network_idle_ms=args.idle,
         headless=(not args.headed),
-    )
+        concurrency=args.concurrency,
+    ))
 
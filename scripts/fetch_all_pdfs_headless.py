@@ -5,7 +5,8 @@ Fetch ALL PDFs from SCNAT (scnat.ch + subdomains + portal-cdn.scnat.ch)
 in one pass with visible progress bars.
 
 What it does:
-  1) Crawls HTML pages (headless Chromium) up to --max-pages.
+  1) Crawls HTML pages up to --max-pages: plain HTML fetch first, headless
+     Chromium for pages that need scripts (or all of them with --always-render).
   2) On each page, captures BOTH:
      - <a href="...pdf"> links from the live DOM, and
      - ANY network request URL that contains '.pdf' (XHR/fetch too).
@@ -23,28 +24,47 @@ NOTE: This script ONLY downloads PDFs. We’ll parse+chunk in the next step.
 """
 
 import argparse
+import asyncio
+import email.utils
+import functools
 import hashlib
 import json
 import os
-import queue
 import re
 import sys
 import time
+import urllib.error
+import urllib.request
 import urllib.robotparser as robotparser
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from urllib.parse import urlparse, urljoin, urldefrag
 
-import requests
+import httpx
+from lxml import etree, html as lxml_html
 from tqdm import tqdm
-from playwright.sync_api import sync_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, async_playwright
+
+# HTTP/2 for the download client only if the optional h2 package is installed
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
 
 # --------------------------- CONFIG DEFAULTS ---------------------------
-ALLOWED_ROOTS = {"scnat.ch", "portal-cdn.scnat.ch"}  # allowed host family
+ALLOWED_ROOTS = frozenset({"scnat.ch", "portal-cdn.scnat.ch"})  # allowed host family
 USER_AGENT = "ragchat-pdf-crawler/1.0"
 PAGE_TIMEOUT_MS = 15000
 NETWORK_IDLE_WAIT_MS = 2000
-DOWNLOAD_CHUNK = 1024 * 128
+BLOCKED_RESOURCES = {"image", "media", "font"}  # never carry links; aborted while rendering
+STATIC_MIN_ANCHORS = 5  # fewer links in the raw HTML -> page is rendered in Chromium instead
+DOWNLOAD_BUF_MIN = 32 * 1024   # first write batch per PDF ...
+DOWNLOAD_BUF_MAX = 1024 * 1024 # ... doubling up to this
+MAX_DOWNLOAD_WORKERS = 32      # upper bound for the adaptive download concurrency
+THROUGHPUT_SAMPLE_S = 2.0      # how often download concurrency is re-evaluated
+DOWNLOAD_RETRIES = 3           # attempts per PDF on 429/5xx
+RETRY_AFTER_MAX_S = 120.0      # longest Retry-After we are willing to honour
+ROBOTS_MAX_BYTES = 500 * 1024  # robots.txt past 500 KiB is ignored (Google's limit)
 
 OUT_RAW = Path("data/raw")
 OUT_AUDIT = Path("data/audits")
@@ -52,29 +72,64 @@ OUT_RAW.mkdir(parents=True, exist_ok=True)
 OUT_AUDIT.mkdir(parents=True, exist_ok=True)
 
 # --------------------------- HELPERS ----------------------------------
+def host_allowed(h: str) -> bool:
+    return h in ALLOWED_ROOTS or any(h.endswith("." + root) for root in ALLOWED_ROOTS)
+
 def is_allowed_host(u: str) -> bool:
     try:
         h = urlparse(u).hostname or ""
     except Exception:
         return False
-    if h in ALLOWED_ROOTS:
-        return True
-    return any(h.endswith("." + root) for root in ALLOWED_ROOTS)
+    return host_allowed(h)
 
 def norm_abs(base: str, href: str) -> str:
     u = urljoin(base, (href or "").strip())
     u, _ = urldefrag(u)
     return u
 
-def looks_pdf(u: str) -> bool:
-    # match .pdf at end of path or before querystring
-    return bool(re.search(r"\.pdf($|\?)", u, re.IGNORECASE))
+_PDF_RX = re.compile(r"\.pdf($|\?)", re.IGNORECASE).search
 
+def looks_pdf(u: str) -> bool:
+    # match .pdf at end of path or before querystring; the substring test
+    # rejects nearly every request URL before the regex runs
+    return ".pdf" in u.lower() and _PDF_RX(u) is not None
+
+# static HTML fast path: these markers mean the links are put in by scripts
+_JS_MARKERS = re.compile(
+    rb"""<script[^>]*type=["']?module|__NEXT_DATA__|data-reactroot|ng-app|<div[^>]+id=["']?(?:app|root)["'\s>]""",
+    re.IGNORECASE,
+)
+_A_HREFS = etree.XPath("//a/@href", smart_strings=False)
+_DATA_PDF = etree.XPath("//@*[starts-with(name(), 'data-')][contains(translate(., 'PDF', 'pdf'), '.pdf')]", smart_strings=False)
+
+@functools.lru_cache(maxsize=200_000)
 def sha16(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8")).hexdigest()[:16]
 
-# robots.txt cache per host
+# robots.txt cache per host, plus memoized per-URL decisions
 _ROBOTS = {}
+def _load_robots(scheme: str, host: str) -> robotparser.RobotFileParser:
+    # same status handling as RobotFileParser.read(), but only the first ROBOTS_MAX_BYTES are read
+    rp = robotparser.RobotFileParser()
+    req = urllib.request.Request(f"{scheme}://{host}/robots.txt", headers={"User-Agent": USER_AGENT})
+    try:
+        with urllib.request.urlopen(req, timeout=PAGE_TIMEOUT_MS / 1000) as f:
+            rp.parse(f.read(ROBOTS_MAX_BYTES).decode("utf-8", errors="ignore").splitlines())
+    except urllib.error.HTTPError as e:
+        if e.code in (401, 403):
+            rp.disallow_all = True
+        elif 400 <= e.code < 500:
+            rp.allow_all = True
+        # 5xx: parser stays unread, can_fetch() is False (as in read())
+    except Exception:
+        pass  # unread parser: can_fetch() is False
+    return rp
+
+@functools.lru_cache(maxsize=4096)
+def _robots_decision(host: str, u: str) -> bool:
+    # the same PDF/asset URLs show up as requests on many pages
+    return _ROBOTS[host].can_fetch(USER_AGENT, u)
+
 def can_fetch(u: str) -> bool:
     try:
         pr = urlparse(u)
@@ -83,14 +138,8 @@ def can_fetch(u: str) -> bool:
     except Exception:
         return False
     if host not in _ROBOTS:
-        rp = robotparser.RobotFileParser()
-        rp.set_url(f"{scheme}://{host}/robots.txt")
-        try:
-            rp.read()
-        except Exception:
-            pass
-        _ROBOTS[host] = rp
-    return _ROBOTS[host].can_fetch(USER_AGENT, u)
+        _ROBOTS[host] = _load_robots(scheme, host)
+    return _robots_decision(host, u)
 
 def target_paths_for(url: str) -> tuple[Path, Path]:
     sid = sha16(url)
@@ -103,84 +152,209 @@ def target_paths_for(url: str) -> tuple[Path, Path]:
     return pdf_path, meta_path
 
 # --------------------------- DISCOVERY --------------------------------
-def discover_pdf_urls(seeds: list[str], max_pages: int, rate_ms: int) -> list[str]:
-    """BFS crawl with Playwright, capturing anchor hrefs AND ALL network requests that contain '.pdf'."""
+async def can_fetch_async(u: str) -> bool:
+    # robots.txt is fetched with blocking urllib: do the first lookup per host in a thread
+    host = urlparse(u).hostname or ""
+    if host in _ROBOTS:
+        return _robots_decision(host, u)
+    return await asyncio.to_thread(can_fetch, u)
+
+class HostRateLimiter:
+    """Politeness delay per host, shared by all workers; slots are reserved up front and the sleep holds no lock."""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.next_ok = {}
+
+    async def acquire(self, host: str):
+        now = time.monotonic()
+        slot = max(now, self.next_ok.get(host, 0.0))
+        self.next_ok[host] = slot + self.delay
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+def sort_hrefs(base: str, hrefs, pdfs: set, links: list):
+    # split raw hrefs into PDF candidates and HTML pages to crawl next
+    for href in hrefs:
+        if not href or href.startswith("javascript:"):
+            continue
+        absu = norm_abs(base, href)
+        if not is_allowed_host(absu):
+            continue
+        if looks_pdf(absu):
+            pdfs.add(absu)
+        elif absu.startswith(("http://", "https://")):
+            links.append(absu)
+
+async def static_fetch(client: httpx.AsyncClient, u: str):
+    """The page as plain HTML (a 200 text/html response), or None."""
+    try:
+        r = await client.get(u)
+    except httpx.HTTPError:
+        return None
+    if r.status_code != 200 or "html" not in r.headers.get("Content-Type", "").lower():
+        return None
+    return r
+
+def static_hrefs(r: httpx.Response):
+    """(final URL, hrefs) from the raw HTML, or None when the page needs a real browser."""
+    if _JS_MARKERS.search(r.content):
+        return None
+    try:
+        doc = lxml_html.fromstring(r.content)
+    except (etree.ParserError, ValueError):
+        return None
+    anchors = _A_HREFS(doc)
+    if len(anchors) < STATIC_MIN_ANCHORS:
+        return None  # next to no links in the HTML: probably rendered client-side
+    return str(r.url), anchors + _DATA_PDF(doc)
+
+# headers that describe httpx's wire encoding, not the decoded body handed to the browser
+_HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+async def discover_pdf_urls(
+    seeds: list[str],
+    max_pages: int,
+    rate_ms: int,
+    render_workers: int = 6,
+    static_first: bool = True,
+) -> list[str]:
+    """BFS crawl with Playwright, capturing anchor hrefs AND ALL network requests that contain '.pdf'.
+
+    With static_first, each page is fetched as plain HTML first; Playwright only
+    renders pages that look script-driven.
+    """
     visited = set()
-    q = queue.Queue()
+    q = asyncio.Queue()
     for s in seeds:
         if is_allowed_host(s):
-            q.put(s)
+            q.put_nowait(s)
 
     pdf_urls = set()
+    pages_started = 0
     pages_processed = 0
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        ctx = browser.new_context(
-            viewport={"width": 1366, "height": 900},
-            user_agent=USER_AGENT,
-        )
-
+    pages_static = 0
+    rate = HostRateLimiter(max(rate_ms, 0) / 1000.0)
+
+    async with async_playwright() as p, httpx.AsyncClient(
+        http2=HTTP2,
+        timeout=PAGE_TIMEOUT_MS / 1000,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+    ) as client:
+        browser = await p.chromium.launch(headless=True)
         # progress bar for pages
         bar = tqdm(total=max_pages, desc="Pages rendered", unit="page")
-        while not q.empty() and pages_processed < max_pages:
-            u = q.get()
-            if u in visited:
-                continue
-            visited.add(u)
-
-            if not is_allowed_host(u) or not u.startswith(("http://", "https://")):
-                continue
-            if not can_fetch(u):
-                continue
-
-            page = ctx.new_page()
-
-            # capture ANY network request that looks like a PDF
-            session_pdf = set()
-            def on_request(req):
-                ru = req.url
-                if looks_pdf(ru) and is_allowed_host(ru) and can_fetch(ru):
-                    session_pdf.add(ru)
-            page.on("request", on_request)
 
+        async def render(ctx, u: str, prefetched: httpx.Response = None):
+            # capture ANY network request that looks like a PDF; robots is checked after the page.
+            # One route handler both records and filters, so each request crosses into Python once.
+            # A page already fetched statically is served to the browser from that response,
+            # so the host sees its HTML requested only once.
+            requested = set()
+            if prefetched is not None:
+                u = str(prefetched.url)
+            async def on_route(route):
+                nonlocal prefetched
+                req = route.request
+                ru = req.url
+                if prefetched is not None and req.is_navigation_request():  # the goto() itself comes first
+                    headers = {k: v for k, v in prefetched.headers.items() if k.lower() not in _HOP_HEADERS}
+                    body, prefetched = prefetched.content, None
+                    await route.fulfill(status=200, headers=headers, body=body)
+                elif looks_pdf(ru) and host_allowed(urlparse(ru).hostname or ""):
+                    requested.add(ru)
+                    # the URL is all we need here; the download step fetches the body
+                    await route.abort()
+                elif req.resource_type in BLOCKED_RESOURCES:
+                    await route.abort()
+                else:
+                    await route.continue_()
+
+            page = None
+            links = []
             try:
-                page.goto(u, timeout=PAGE_TIMEOUT_MS, wait_until="domcontentloaded")
-                page.wait_for_timeout(NETWORK_IDLE_WAIT_MS)
+                page = await ctx.new_page()
+                await page.route("**/*", on_route)
+                await page.goto(u, timeout=PAGE_TIMEOUT_MS, wait_until="domcontentloaded")
+                # wait for the network to settle, but no longer than NETWORK_IDLE_WAIT_MS
+                try:
+                    await page.wait_for_load_state("networkidle", timeout=NETWORK_IDLE_WAIT_MS)
+                except PlaywrightTimeoutError:
+                    pass
 
                 # also inspect the live DOM for anchors
-                anchors = page.eval_on_selector_all("a", "els => els.map(e => e.getAttribute('href'))") or []
-                for href in anchors:
-                    if not href or href.startswith("javascript:"):
-                        continue
-                    absu = norm_abs(u, href)
-                    if not is_allowed_host(absu):
-                        continue
-                    if looks_pdf(absu):
-                        if can_fetch(absu):
-                            session_pdf.add(absu)
-                    else:
-                        # enqueue more HTML pages (basic BFS)
-                        if absu not in visited and absu.startswith(("http://", "https://")) and can_fetch(absu):
-                            q.put(absu)
-
+                anchors = await page.eval_on_selector_all("a", "els => els.map(e => e.getAttribute('href'))") or []
+                sort_hrefs(u, anchors, requested, links)
             except Exception:
                 # ignore navigation/render errors; keep crawling
                 pass
             finally:
-                page.close()
-
-            # record PDFs found on this page
-            if session_pdf:
-                pdf_urls.update(session_pdf)
-
-            pages_processed += 1
-            bar.update(1)
-            if rate_ms > 0:
-                time.sleep(rate_ms / 1000.0)
+                if page is not None:
+                    await page.close()
+            return requested, links
+
+        async def worker(ctx):
+            nonlocal pages_started, pages_processed, pages_static
+            while True:
+                u = await q.get()
+                try:
+                    # no await between check and update, so visited/q need no lock
+                    if u in visited or pages_started >= max_pages:
+                        continue
+                    visited.add(u)
+                    if not is_allowed_host(u) or not u.startswith(("http://", "https://")):
+                        continue
+                    if not await can_fetch_async(u):
+                        continue
+                    pages_started += 1
+
+                    # one politeness slot per request for the page itself, shared by all workers
+                    host = urlparse(u).hostname or ""
+                    r = None
+                    if static_first:
+                        await rate.acquire(host)
+                        r = await static_fetch(client, u)
+                    static = static_hrefs(r) if r is not None else None
+                    if static is not None:
+                        requested, links = set(), []
+                        sort_hrefs(static[0], static[1], requested, links)
+                        pages_static += 1
+                    else:
+                        if r is None:  # nothing usable fetched yet: the browser loads the page
+                            await rate.acquire(host)
+                        requested, links = await render(ctx, u, r)
+                    # record PDFs found on this page
+                    for ru in requested:
+                        if await can_fetch_async(ru):
+                            pdf_urls.add(ru)
+                    # enqueue more HTML pages (basic BFS)
+                    for absu in links:
+                        if absu not in visited and await can_fetch_async(absu):
+                            q.put_nowait(absu)
+
+                    pages_processed += 1
+                    bar.update(1)
+                finally:
+                    q.task_done()
+
+        # one context per worker, reused for every page it renders
+        contexts = [
+            await browser.new_context(
+                viewport={"width": 1366, "height": 900},
+                user_agent=USER_AGENT,
+            )
+            for _ in range(max(1, render_workers))
+        ]
+        workers = [asyncio.create_task(worker(ctx)) for ctx in contexts]
+        await q.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for ctx in contexts:
+            await ctx.close()
 
         bar.close()
-        browser.close()
+        await browser.close()
 
     # write discovered list
     out_list = OUT_AUDIT / "pdf_urls_discovered.txt"
@@ -188,59 +362,187 @@ def discover_pdf_urls(seeds: list[str], max_pages: int, rate_ms: int) -> list[st
 
     print("\n=== Discovery Summary ===")
     print(f"Pages attempted:   {min(pages_processed, max_pages)}")
+    print(f"  static HTML:     {pages_static}")
     print(f"Unique PDFs found: {len(pdf_urls)}")
     print(f"List written:      {out_list}")
     return sorted(pdf_urls)
 
 # --------------------------- DOWNLOAD ---------------------------------
-def download_one(url: str) -> tuple[str, bool, int]:
-    pdf_path, meta_path = target_paths_for(url)
-    if pdf_path.exists() and meta_path.exists() and pdf_path.stat().st_size > 0:
-        return (url, True, pdf_path.stat().st_size)
+class AdaptiveGate:
+    """AIMD download concurrency: +1 slot while throughput keeps rising, halved on 429/5xx.
+
+    A Retry-After from the server holds back new requests until it has passed.
+    """
+    def __init__(self, start: int, hi: int = MAX_DOWNLOAD_WORKERS):
+        self.hi = hi
+        self.limit = max(1, min(start, hi))
+        self.active = 0
+        self.bytes = 0
+        self.resume_at = 0.0
+        self._throttled = 0
+        self._prev_bytes = 0
+        self._prev_rate = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            while True:
+                wait = self.resume_at - time.monotonic()
+                if wait <= 0 and self.active < self.limit:
+                    break
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            self.active += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def add_bytes(self, n: int):
+        self.bytes += n
+
+    def throttled(self, retry_after: float = 0.0):
+        self._throttled += 1
+        if retry_after > 0:
+            self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+
+    async def sample(self, interval: float) -> int:
+        """Called every THROUGHPUT_SAMPLE_S by the controller; returns the new limit."""
+        async with self._cond:
+            rate = (self.bytes - self._prev_bytes) / interval
+            if self._throttled:
+                self.limit = max(1, self.limit // 2)
+            elif rate > self._prev_rate * 1.05:
+                self.limit = min(self.hi, self.limit + 1)
+            elif rate < self._prev_rate * 0.95:
+                self.limit = max(1, self.limit - 1)
+            self._prev_bytes, self._prev_rate, self._throttled = self.bytes, rate, 0
+            self._cond.notify_all()
+            return self.limit
+
+def retry_after_seconds(value: str | None) -> float:
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return 0.0
     try:
-        r = requests.get(url, headers={"User-Agent": USER_AGENT}, stream=True, timeout=30)
-        if r.status_code != 200:
-            return (url, False, 0)
-        total = int(r.headers.get("Content-Length") or 0)
-        size = 0
-        with open(pdf_path, "wb") as f, tqdm(
+        secs = float(value)
+    except ValueError:
+        try:
+            secs = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return 0.0
+    return min(max(secs, 0.0), RETRY_AFTER_MAX_S)
+
+def _pwrite_all(fd: int, data: bytearray, offset: int):
+    view = memoryview(data)
+    written = 0
+    while written < len(data):
+        written += os.pwrite(fd, view[written:], offset + written)
+
+async def _save_pdf(url: str, r: httpx.Response, pdf_path: Path, meta_path: Path, gate: AdaptiveGate) -> int:
+    total = int(r.headers.get("Content-Length") or 0)
+    size = 0
+    # network chunks are collected into one growing batch and pwrite()n at the running offset;
+    # the batch starts at DOWNLOAD_BUF_MIN and doubles up to DOWNLOAD_BUF_MAX, so small PDFs
+    # stay small and large ones need few write calls
+    want = DOWNLOAD_BUF_MIN
+    buf = bytearray()
+    fd = os.open(pdf_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        with tqdm(
             total=total if total > 0 else None,
             unit="B",
             unit_scale=True,
             desc=os.path.basename(pdf_path),
             leave=False,
         ) as bar:
-            for chunk in r.iter_content(DOWNLOAD_CHUNK):
-                if not chunk:
+            async for chunk in r.aiter_bytes():
+                buf += chunk
+                gate.add_bytes(len(chunk))
+                if len(buf) < want:
                     continue
-                f.write(chunk)
-                size += len(chunk)
-                bar.update(len(chunk))
-        meta = {
-            "url": url,
-            "content_type": "application/pdf",
-            "saved_at": int(time.time()),
-            "size": size,
-            "source": "headless_crawl",
-        }
-        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-        return (url, True, size)
-    except Exception:
-        return (url, False, 0)
+                _pwrite_all(fd, buf, size)
+                size += len(buf)
+                bar.update(len(buf))
+                buf.clear()
+                want = min(want * 2, DOWNLOAD_BUF_MAX)
+            if buf:
+                _pwrite_all(fd, buf, size)
+                size += len(buf)
+                bar.update(len(buf))
+    finally:
+        os.close(fd)
+    meta = {
+        "url": url,
+        "content_type": "application/pdf",
+        "saved_at": int(time.time()),
+        "size": size,
+        "source": "headless_crawl",
+    }
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    return size
+
+async def download_one(client: httpx.AsyncClient, url: str, gate: AdaptiveGate) -> tuple[str, bool, int]:
+    pdf_path, meta_path = target_paths_for(url)
+    if pdf_path.exists() and meta_path.exists() and pdf_path.stat().st_size > 0:
+        return (url, True, pdf_path.stat().st_size)
+    for attempt in range(DOWNLOAD_RETRIES):
+        async with gate:
+            try:
+                async with client.stream("GET", url) as r:
+                    if r.status_code == 200:
+                        return (url, True, await _save_pdf(url, r, pdf_path, meta_path, gate))
+                    if r.status_code != 429 and r.status_code < 500:
+                        return (url, False, 0)
+                    delay = retry_after_seconds(r.headers.get("Retry-After"))
+                    gate.throttled(delay)
+            except Exception:
+                return (url, False, 0)
+        # without Retry-After, back off on our own (outside the gate)
+        if not delay:
+            await asyncio.sleep(2 ** attempt)
+    return (url, False, 0)
 
-def download_all(urls: list[str], workers: int) -> tuple[int, int]:
+async def download_all(urls: list[str], workers: int) -> tuple[int, int]:
     ok = 0
     bytes_dl = 0
     urls = list(dict.fromkeys(urls))  # dedupe, keep order
 
-    with ThreadPoolExecutor(max_workers=workers) as ex, tqdm(total=len(urls), desc="PDFs downloaded", unit="pdf") as pbar:
-        futs = {ex.submit(download_one, u): u for u in urls}
-        for fut in as_completed(futs):
-            _, success, size = fut.result()
-            if success:
-                ok += 1
-                bytes_dl += size
-            pbar.update(1)
+    # one client (and connection pool) for every download; the gate decides how many run at once
+    gate = AdaptiveGate(workers)
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    async with httpx.AsyncClient(
+        http2=HTTP2,
+        limits=limits,
+        timeout=30,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+    ) as client:
+        with tqdm(total=len(urls), desc="PDFs downloaded", unit="pdf") as pbar:
+            async def control():
+                last_sample = time.monotonic()
+                while True:
+                    await asyncio.sleep(THROUGHPUT_SAMPLE_S)
+                    now = time.monotonic()
+                    pbar.set_postfix(workers=await gate.sample(now - last_sample))
+                    last_sample = now
+
+            async def one(u: str):
+                nonlocal ok, bytes_dl
+                _, success, size = await download_one(client, u, gate)
+                if success:
+                    ok += 1
+                    bytes_dl += size
+                pbar.update(1)
+
+            controller = asyncio.create_task(control())
+            try:
+                await asyncio.gather(*(one(u) for u in urls))
+            finally:
+                controller.cancel()
 
     return ok, bytes_dl
 
@@ -249,12 +551,16 @@ def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--seed", nargs="+", default=["https://scnat.ch"], help="Seed URLs (space separated)")
     ap.add_argument("--max-pages", type=int, default=3000, help="Max HTML pages to render")
-    ap.add_argument("--rate-ms", type=int, default=200, help="Delay between page renders (ms)")
-    ap.add_argument("--workers", type=int, default=6, help="Concurrent PDF downloads")
+    ap.add_argument("--rate-ms", type=int, default=200, help="Delay between page requests to the same host, across all workers (ms)")
+    ap.add_argument("--render-workers", type=int, default=6, help="Pages rendered in parallel")
+    ap.add_argument("--always-render", action="store_true", help="Render every page in Chromium (no static HTML fast path)")
+    ap.add_argument("--workers", type=int, default=6, help="Initial concurrent PDF downloads (adapts up to 32)")
     args = ap.parse_args()
 
     # 1) Discover all PDF URLs
-    pdf_urls = discover_pdf_urls(args.seed, args.max_pages, args.rate_ms)
+    pdf_urls = asyncio.run(discover_pdf_urls(
+        args.seed, args.max_pages, args.rate_ms, args.render_workers, static_first=not args.always_render,
+    ))
 
     if not pdf_urls:
         print("\nNo PDF URLs discovered. If you believe more exist, increase --max-pages or try again later.")
@@ -262,7 +568,7 @@ def main():
 
     # 2) Download PDFs with progress bars (resumable)
     print("\nStarting downloads…")
-    saved, bytes_dl = download_all(pdf_urls, args.workers)
+    saved, bytes_dl = asyncio.run(download_all(pdf_urls, args.workers))
 
     print("\n=== Download Summary ===")
     print(f"PDF URLs discovered: {len(pdf_urls)}")
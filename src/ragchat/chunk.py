@@ -1,54 +1,88 @@
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import json
-from typing import List
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import orjson
 from rich.console import Console
 
+from ragchat.chunkstore import write_chunks
+from ragchat.index_sparse import tokenize
+
 console = Console()
 
 
 def chunk_text(text: str, size: int = 512, overlap: int = 64) -> List[str]:
     """Simple word-window chunking. Adjust size/overlap freely."""
-    text = " ".join((text or "").split())
-    if not text:
-        return []
-    words = text.split()
+    words = (text or "").split()
     if not words:
         return []
+    text = " ".join(words)
 
-    chunks: List[str] = []
+    # words are single-space separated now, so every window is one slice of `text`:
+    # word offsets come from a cumsum over word lengths instead of a join per window
+    n = len(words)
     step = max(size - overlap, 1)
-    for start in range(0, len(words), step):
-        piece = " ".join(words[start : start + size]).strip()
-        if piece:
-            chunks.append(piece)
-    return chunks
+    lens = np.fromiter(map(len, words), dtype=np.int64, count=n)
+    ends = np.cumsum(lens + 1) - 1
+    first = np.arange(0, n, step)
+    last = np.minimum(first + size, n) - 1
+    starts = (ends[first] - lens[first]).tolist()
+    stops = ends[last].tolist()
+    return [text[a:b] for a, b in zip(starts, stops)]
+
 
+def _chunk_one(f: Path, out_dir: Path, size: int, overlap: int) -> Tuple[str, List[str], List[List[str]]]:
+    """Chunk one processed JSON file; top-level so worker processes can pickle it.
+    Returns (source_file, chunks, BM25 tokens per chunk) for the chunk store."""
+    data = orjson.loads(f.read_bytes())
+    text = data.get("text") or ""
+    chunks = [c for c in chunk_text(text, size=size, overlap=overlap) if c.strip()]
+    src = data.get("source_file", str(f))
 
-def chunk_all(processed_dir: Path, out_dir: Path, size: int = 512, overlap: int = 64):
+    out_path = out_dir / (f.stem + ".chunks.json")
+    out_data = {
+        "chunks": chunks,
+        "meta": {
+            "source_file": src,
+            "source_type": data.get("source_type", "unknown"),
+            "url": data.get("url"),
+            "content_type": data.get("content_type"),
+        },
+    }
+    out_path.write_bytes(orjson.dumps(out_data, option=orjson.OPT_INDENT_2))
+    return src, chunks, tokenize(chunks)
+
+
+def chunk_all(processed_dir: Path, out_dir: Path, size: int = 512, overlap: int = 64, workers: Optional[int] = None):
     out_dir.mkdir(parents=True, exist_ok=True)
     n_files = 0
     total_chunks = 0
 
-    for f in sorted(processed_dir.glob("*.json")):
-        data = json.loads(f.read_text(encoding="utf-8"))
-        text = data.get("text") or ""
-        chunks = chunk_text(text, size=size, overlap=overlap)
-
-        out_path = out_dir / (f.stem + ".chunks.json")
-        out_data = {
-            "chunks": chunks,
-            "meta": {
-                "source_file": data.get("source_file", str(f)),
-                "source_type": data.get("source_type", "unknown"),
-                "url": data.get("url"),
-                "content_type": data.get("content_type"),
-            },
-        }
-        out_path.write_text(json.dumps(out_data, ensure_ascii=False, indent=2), encoding="utf-8")
-
-        console.print(f"✂️  {f.name} → {len(chunks)} chunks")
-        n_files += 1
-        total_chunks += len(chunks)
+    files = sorted(processed_dir.glob("*.json"))
+    results = {}
+    # files are independent and the work is pure-Python CPU, so spread it over processes
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        futs = {ex.submit(_chunk_one, f, out_dir, size, overlap): f for f in files}
+        for fut in as_completed(futs):
+            f = futs[fut]
+            results[f] = fut.result()
+            n_chunks = len(results[f][1])
+            console.print(f"✂️  {f.name} → {n_chunks} chunks")
+            n_files += 1
+            total_chunks += n_chunks
+
+    # one chunk store in file order, so chunk_ids are stable and both indices agree on them
+    texts: List[str] = []
+    sources: List[str] = []
+    tokens: List[List[str]] = []
+    for f in files:
+        src, chunks, toks = results[f]
+        texts += chunks
+        sources += [src] * len(chunks)
+        tokens += toks
+    write_chunks(out_dir, texts, sources, tokens)
 
     console.print(f"[bold cyan]Chunking done:[/bold cyan] {n_files} files, {total_chunks} chunks → {out_dir}")
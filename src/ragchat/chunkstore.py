@@ -0,0 +1,65 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+import pickle
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# every chunk once, written by chunk_all and read by both index builders and HybridIndex;
+# the indices' meta.jsonl rows only carry the chunk_id (= row number here)
+CHUNKS_FILE = "chunks.parquet"
+# BM25 token -> id; the tokens column holds the ids, so re-indexing never hashes strings
+VOCAB_FILE = "bm25_vocab.pkl"
+
+
+@dataclass
+class ChunkRecord:
+    chunk_id: int
+    text: str
+    source_file: str
+    tokens: List[int] = field(default_factory=list)  # BM25 token ids (see VOCAB_FILE)
+
+
+def write_chunks(chunks_dir: Path, texts: List[str], source_files: List[str], tokens: List[List[str]]) -> None:
+    """Write the chunk store; `tokens` are index_sparse.tokenize() output, stored as ids."""
+    vocab: Dict[str, int] = {}
+    lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+    ids = np.fromiter(
+        (vocab.setdefault(t, len(vocab)) for doc in tokens for t in doc), dtype=np.uint32, count=int(lengths.sum())
+    )
+    # list<uint32> column = CSR (offsets + one flat id buffer), no per-token Python objects on read
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+    table = pa.table({
+        "chunk_id": pa.array(range(len(texts)), type=pa.int64()),
+        "text": pa.array(texts, type=pa.string()),
+        "source_file": pa.array(source_files, type=pa.string()),
+        "tokens": pa.ListArray.from_arrays(pa.array(offsets), pa.array(ids)),
+    })
+    pq.write_table(table, chunks_dir / CHUNKS_FILE)
+    with open(chunks_dir / VOCAB_FILE, "wb") as fh:
+        pickle.dump(vocab, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_vocab(chunks_dir: Path) -> Dict[str, int]:
+    with open(chunks_dir / VOCAB_FILE, "rb") as fh:
+        return pickle.load(fh)
+
+
+def iter_chunks(chunks_dir: Path, tokens: bool = False) -> Iterator[ChunkRecord]:
+    """Chunks in chunk_id order; the token id lists are only decoded when asked for."""
+    columns = ["chunk_id", "text", "source_file"] + (["tokens"] if tokens else [])
+    pf = pq.ParquetFile(chunks_dir / CHUNKS_FILE, memory_map=True)
+    for batch in pf.iter_batches(columns=columns):
+        cols = batch.to_pydict()
+        toks = cols["tokens"] if tokens else [[] for _ in range(batch.num_rows)]
+        for cid, text, src, tk in zip(cols["chunk_id"], cols["text"], cols["source_file"], toks):
+            yield ChunkRecord(chunk_id=cid, text=text, source_file=src, tokens=tk)
+
+
+def read_texts(path: Path) -> List[str]:
+    """Chunk texts indexed by chunk_id."""
+    table = pq.read_table(path, columns=["text"], memory_map=True)
+    return table.column("text").to_pylist()
@@ -57,6 +57,7 @@ def crawl_cmd(
     obey_robots: bool = typer.Option(True, "--obey-robots/--ignore-robots", help="Respect robots.txt"),
     include_subdomains: bool = typer.Option(True, "--include-subdomains/--no-subdomains", help="Follow subdomains"),
     use_sitemaps: bool = typer.Option(True, "--use-sitemaps/--no-sitemaps", help="Seed from robots Sitemap entries"),
+    workers: int = typer.Option(None, "--workers", help="Concurrent fetches"),
 ):
     """Mirror HTML & PDFs across allowed domains."""
     base = project_root()
@@ -75,6 +76,7 @@ def crawl_cmd(
         raw_dir=base / (cfg.get("paths", {}).get("raw_dir") or "data/raw"),
         include_subdomains=include_subdomains,
         use_sitemaps=use_sitemaps,
+        workers=workers if workers is not None else int(cfg["crawl"].get("workers", 16)),
     )
 
     import asyncio as _asyncio
@@ -82,14 +84,14 @@ def crawl_cmd(
 
 # The other commands can stay; we won't use them until later.
 @app.command()
-def parse_cmd():
+def parse_cmd(workers: int = 0):
     base = project_root()
-    parse_all(base / "data" / "raw", base / "data" / "processed")
+    parse_all(base / "data" / "raw", base / "data" / "processed", workers=workers or None)
 
 @app.command()
-def chunk_cmd(size: int = 512, overlap: int = 64):
+def chunk_cmd(size: int = 512, overlap: int = 64, workers: int = 0):
     base = project_root()
-    chunk_all(base / "data" / "processed", base / "data" / "indices", size=size, overlap=overlap)
+    chunk_all(base / "data" / "processed", base / "data" / "indices", size=size, overlap=overlap, workers=workers or None)
 
 
 
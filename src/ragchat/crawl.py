@@ -1,19 +1,21 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import hashlib
-import json
 import re
 import time
-from collections import deque, defaultdict
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterable, Optional, Set, List
 from urllib.parse import urljoin, urlparse, urldefrag
 
 import httpx
-from bs4 import BeautifulSoup
+import orjson
+from lxml import etree, html as lxml_html
 from rich.console import Console
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn
 from urllib import robotparser
 
 USER_AGENT = "ragchat-mirror/0.2 (+local)"
@@ -33,6 +35,8 @@ class CrawlConfig:
     raw_dir: Path = Path("data/raw")
     include_subdomains: bool = True
     use_sitemaps: bool = True
+    workers: int = 16  # concurrent fetches
+    max_in_flight_per_domain: int = 4
 
 
 def _norm_url(base: str, href: str) -> Optional[str]:
@@ -70,55 +74,125 @@ def _domain_allowed(url: str, allow_domains: Iterable[str], include_subdomains:
     return False
 
 
+ROBOTS_MAX_BYTES = 500 * 1024  # robots.txt past 500 KiB is ignored (Google's limit)
+
+
 class RobotsCache:
-    def __init__(self, client: httpx.Client):
+    def __init__(self, client: httpx.AsyncClient, max_decisions: int = 4096):
         self.client = client
         self.cache: dict[str, robotparser.RobotFileParser] = {}
         self.sitemap_urls: dict[str, list[str]] = {}
+        self._pending: dict[str, asyncio.Future] = {}
+        # memoized can_fetch() results, keyed by (netloc, url)
+        self._decide = functools.lru_cache(maxsize=max_decisions)(self._can_fetch)
+
+    async def _read_robots(self, robots_url: str) -> tuple[int, str]:
+        # stream and stop after ROBOTS_MAX_BYTES; the body only matters below 400
+        async with self.client.stream("GET", robots_url, headers={"User-Agent": USER_AGENT}, timeout=10) as resp:
+            if resp.status_code >= 400:
+                return resp.status_code, ""
+            buf = bytearray()
+            async for chunk in resp.aiter_bytes():
+                buf += chunk
+                if len(buf) >= ROBOTS_MAX_BYTES:
+                    break
+        return resp.status_code, bytes(buf[:ROBOTS_MAX_BYTES]).decode("utf-8", errors="ignore")
+
+    async def _load(self, scheme: str, netloc: str) -> robotparser.RobotFileParser:
+        # same status handling as RobotFileParser.read(): 401/403 deny, other 4xx allow,
+        # 5xx/unreachable leave the parser unread (can_fetch is False) and are not cached,
+        # so a later lookup tries again
+        rp = robotparser.RobotFileParser()
+        try:
+            status, text = await self._read_robots(f"{scheme}://{netloc}/robots.txt")
+        except Exception:
+            return rp
+        if status in (401, 403):
+            rp.disallow_all = True
+        elif 400 <= status < 500:
+            rp.allow_all = True
+        elif status >= 500:
+            return rp
+        else:
+            lines = text.splitlines()
+            rp.parse(lines)
+            # collect Sitemap: lines
+            self.sitemap_urls[netloc] = [
+                line.split(":", 1)[1].strip() for line in lines if line.lower().startswith("sitemap:")
+            ]
+        self.cache[netloc] = rp
+        return rp
+
+    async def _parser_for(self, scheme: str, netloc: str) -> robotparser.RobotFileParser:
+        # concurrent first lookups of a host share one robots.txt fetch
+        fut = self._pending.get(netloc)
+        if fut is None:
+            fut = self._pending[netloc] = asyncio.ensure_future(self._load(scheme, netloc))
+        try:
+            return await asyncio.shield(fut)  # one cancelled waiter must not cancel the others
+        finally:
+            if fut.done():
+                self._pending.pop(netloc, None)
+
+    def _can_fetch(self, netloc: str, url: str) -> bool:
+        return self.cache[netloc].can_fetch(USER_AGENT, url)
 
-    def allowed(self, url: str) -> bool:
-        netloc = urlparse(url).netloc
+    async def allowed(self, url: str) -> bool:
+        parsed = urlparse(url)  # split once, reused for the robots URL and the cache key
+        netloc = parsed.netloc
         if netloc not in self.cache:
-            rp = robotparser.RobotFileParser()
-            robots_url = f"{urlparse(url).scheme}://{netloc}/robots.txt"
-            try:
-                resp = self.client.get(robots_url, headers={"User-Agent": USER_AGENT}, timeout=10)
-                if resp.status_code >= 400:
-                    rp.parse([])
-                else:
-                    lines = resp.text.splitlines()
-                    rp.parse(lines)
-                    # collect Sitemap: lines
-                    sitemaps = []
-                    for line in lines:
-                        if line.lower().startswith("sitemap:"):
-                            sitemaps.append(line.split(":", 1)[1].strip())
-                    self.sitemap_urls[netloc] = sitemaps
-            except Exception:
-                rp.parse([])
-                self.sitemap_urls[netloc] = []
-            self.cache[netloc] = rp
-        return self.cache[netloc].can_fetch(USER_AGENT, url)
+            rp = await self._parser_for(parsed.scheme, netloc)
+            if netloc not in self.cache:  # transient failure: deny, don't memoize
+                return rp.can_fetch(USER_AGENT, url)
+        return self._decide(netloc, url)
 
     def sitemaps_for(self, url: str) -> list[str]:
         netloc = urlparse(url).netloc
         return self.sitemap_urls.get(netloc, [])
 
 
+class TokenBucket:
+    """`rate` tokens per second, holding at most `capacity` (the allowed burst)."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
 class RateLimiter:
-    def __init__(self, per_domain_rps: float):
-        self.min_interval = 1.0 / max(per_domain_rps, 0.001)
-        self.last: dict[str, float] = defaultdict(lambda: 0.0)
+    """Per host: requests start at most `per_domain_rps` per second, and at most
+    `max_in_flight` of them run at once (slow responses no longer hold back the next start)."""
 
-    async def wait(self, url: str):
+    def __init__(self, per_domain_rps: float, max_in_flight: int = 4):
+        self.rate = max(per_domain_rps, 0.001)
+        self.max_in_flight = max(1, max_in_flight)
+        self.buckets: dict[str, TokenBucket] = {}
+        self.in_flight: dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
         host = urlparse(url).netloc
-        now = time.monotonic()
-        delta = now - self.last[host]
-        if delta < self.min_interval:
-            await asyncio.sleep(self.min_interval - delta)
-        self.last[host] = time.monotonic()
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate)
+            self.in_flight[host] = asyncio.Semaphore(self.max_in_flight)
+        async with self.in_flight[host]:
+            await self.buckets[host].acquire()
+            yield
 
 
+@functools.lru_cache(maxsize=200_000)
 def _hash_name(url: str) -> str:
     return hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
 
@@ -143,13 +217,51 @@ def _save_blob(raw_dir: Path, url: str, content: bytes, content_type: str):
         "saved_path": f"{kind}/{h}{ext}",
         "time": time.time(),
     }
-    (out_dir / f"{h}.meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    (out_dir / f"{h}.meta.json").write_bytes(orjson.dumps(meta))
     return f"{kind}/{h}{ext}"
 
 
+def _write_records(manifest_fh, urls_fh, records: list[tuple[str, str, str]], flush: bool):
+    manifest_fh.writelines(
+        orjson.dumps({"url": url, "content_type": ct, "saved_path": saved_path}) + b"\n"
+        for url, ct, saved_path in records
+    )
+    urls_fh.writelines(url + "\n" for url, _ct, _path in records)
+    if flush:
+        manifest_fh.flush()
+        urls_fh.flush()
+
+
+async def _record_writer(
+    records: asyncio.Queue,
+    manifest_fh,
+    urls_fh,
+    batch: int = 128,
+    flush_every: float = 1.0,
+):
+    """Sole writer of the manifest and urls.txt; `None` on the queue stops it.
+
+    Drains up to `batch` records per round and writes them in a worker thread,
+    so disk I/O never blocks the event loop and lines from parallel fetches
+    can't interleave.
+    """
+    last_flush = time.monotonic()
+    done = False
+    while not done:
+        items = [await records.get()]
+        while len(items) < batch and not records.empty():
+            items.append(records.get_nowait())
+        done = None in items
+        now = time.monotonic()
+        flush = done or now - last_flush >= flush_every
+        await asyncio.to_thread(_write_records, manifest_fh, urls_fh, [r for r in items if r is not None], flush)
+        if flush:
+            last_flush = now
+
+
 async def _fetch(client: httpx.AsyncClient, url: str) -> Optional[httpx.Response]:
     try:
-        return await client.get(url, timeout=20)
+        return await client.get(url)
     except Exception as e:
         console.print(f"[red]Request error:[/red] {url} ({e})")
         return None
@@ -160,14 +272,28 @@ def _should_enqueue(url: str) -> bool:
     return url.lower().endswith(SAVE_SUFFIXES) or True  # enqueue broadly; filter later
 
 
-def _parse_links(base_url: str, html: str) -> list[str]:
-    soup = BeautifulSoup(html, "lxml")
-    hrefs = []
-    for a in soup.find_all("a", href=True):
-        n = _norm_url(base_url, a.get("href"))
-        if n:
-            hrefs.append(n)
-    return hrefs
+_HREFS = etree.XPath("//a/@href", smart_strings=False)
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.I)
+
+
+@functools.lru_cache(maxsize=None)
+def _html_parser(encoding: str) -> lxml_html.HTMLParser:
+    return lxml_html.HTMLParser(encoding=encoding)
+
+
+def _parse_links(base_url: str, html: bytes, encoding: Optional[str] = None) -> list[str]:
+    # raw bytes straight into libxml2, no BS4 tree. Charset: the header's (`encoding`), else
+    # <meta charset> in the first KiB, else UTF-8 (libxml2 alone would guess Latin-1)
+    if not encoding:
+        m = _META_CHARSET.search(html, 0, 1024)
+        encoding = m.group(1).decode("ascii") if m else "utf-8"
+    try:
+        doc = lxml_html.fromstring(html, parser=_html_parser(encoding.lower()))
+    except LookupError:  # unknown charset name
+        return _parse_links(base_url, html, "utf-8") if encoding.lower() != "utf-8" else []
+    except (etree.ParserError, ValueError):
+        return []
+    return [n for n in (_norm_url(base_url, h) for h in _HREFS(doc)) if n]
 
 
 async def _discover_from_sitemaps(client: httpx.AsyncClient, start_urls: list[str]) -> Set[str]:
@@ -175,7 +301,7 @@ async def _discover_from_sitemaps(client: httpx.AsyncClient, start_urls: list[st
     robots = RobotsCache(client)
     for s in start_urls:
         # force robots load
-        robots.allowed(s)
+        await robots.allowed(s)
         for sm in robots.sitemaps_for(s):
             try:
                 r = await _fetch(client, sm)
@@ -200,11 +326,11 @@ async def crawl(config: CrawlConfig, seeds: list[str]):
     manifest_path = raw_dir / "_manifest.jsonl"
     urls_txt = raw_dir / "urls.txt"
     # append-safe
-    manifest_fh = manifest_path.open("a", encoding="utf-8")
+    manifest_fh = manifest_path.open("ab")
     urls_fh = urls_txt.open("a", encoding="utf-8")
 
     seen: set[str] = set()
-    q: deque[str] = deque()
+    q: asyncio.Queue[str] = asyncio.Queue()
 
     seeds_n = []
     for s in seeds:
@@ -218,9 +344,19 @@ async def crawl(config: CrawlConfig, seeds: list[str]):
     console.print(f"Allow domains: {config.allow_domains} (subdomains={'on' if config.include_subdomains else 'off'})")
     console.print(f"Max pages: {config.max_pages}, robots={'on' if config.obey_robots_txt else 'off'}")
 
-    limiter = RateLimiter(config.rate_limit_per_domain)
-
-    async with httpx.AsyncClient(follow_redirects=True, headers={"User-Agent": USER_AGENT}) as aclient:
+    limiter = RateLimiter(config.rate_limit_per_domain, config.max_in_flight_per_domain)
+    workers = max(1, min(config.workers, config.max_pages))
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    timeout = httpx.Timeout(20.0, connect=5.0)
+
+    # HTTP/2: parallel requests to one host share a connection (and its TLS handshake)
+    async with httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+        limits=limits,
+        timeout=timeout,
+    ) as aclient:
         robots = RobotsCache(aclient)
 
         # sitemap discovery (optional)
@@ -228,28 +364,46 @@ async def crawl(config: CrawlConfig, seeds: list[str]):
             discovered = await _discover_from_sitemaps(aclient, seeds_n)
             for u in discovered:
                 if _domain_allowed(u, config.allow_domains, config.include_subdomains):
-                    q.append(u)
+                    q.put_nowait(u)
                     seen.add(u)
 
         # enqueue seeds last so they’re visited early too
         for s in seeds_n:
-            q.append(s)
+            q.put_nowait(s)
             seen.add(s)
 
         saved = 0
         fetched = 0
-        while q and fetched < config.max_pages:
-            url = q.popleft()
-
-            if config.obey_robots_txt and not robots.allowed(url):
-                console.print(f"[dim]robots disallow:[/dim] {url}")
-                continue
-
-            await limiter.wait(url)
-            r = await _fetch(aclient, url)
+        disallowed = 0
+
+        # one live progress line instead of a console.print per URL; warnings still go
+        # through `console` and are rendered above the bar
+        progress = Progress(
+            TextColumn("[bold]Mirror[/bold]"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TextColumn("saved {task.fields[saved]} · robots skip {task.fields[disallowed]}"),
+            TimeElapsedColumn(),
+            console=console,
+        )
+        task_id = progress.add_task("crawl", total=config.max_pages, saved=0, disallowed=0)
+
+        async def handle(url: str):
+            nonlocal saved, fetched, disallowed
+            if config.obey_robots_txt and not await robots.allowed(url):
+                disallowed += 1
+                progress.update(task_id, disallowed=disallowed)
+                return
+            # claim a page slot before awaiting, so workers don't overshoot max_pages
+            if fetched >= config.max_pages:
+                return
             fetched += 1
+
+            async with limiter.slot(url):
+                r = await _fetch(aclient, url)
+            progress.update(task_id, advance=1)
             if not r:
-                continue
+                return
 
             ct = (r.headers.get("content-type") or "").split(";")[0].strip().lower()
             # decide save
@@ -257,15 +411,15 @@ async def crawl(config: CrawlConfig, seeds: list[str]):
             is_html = (ct in HTML_CT) or url.lower().endswith((".html", ".htm", "/"))
             if is_pdf or is_html:
                 saved_path = _save_blob(raw_dir, url, r.content if is_pdf else r.text.encode("utf-8"), ct)
-                manifest_fh.write(json.dumps({"url": url, "content_type": ct, "saved_path": saved_path}) + "\n")
-                urls_fh.write(url + "\n")
+                records.put_nowait((url, ct, saved_path))
                 saved += 1
-                console.print(("📄 PDF " if is_pdf else "🌐 HTML ") + f"saved: {url}")
+                progress.update(task_id, saved=saved)
 
             # enqueue links only from HTML
             if is_html:
                 try:
-                    links = _parse_links(url, r.text)
+                    links = _parse_links(url, r.content, r.charset_encoding)
+                    # no await in this loop: seen/q updates can't interleave with other workers
                     for nurl in links:
                         if nurl in seen:
                             continue
@@ -274,12 +428,36 @@ async def crawl(config: CrawlConfig, seeds: list[str]):
                         if not _should_enqueue(nurl):
                             continue
                         seen.add(nurl)
-                        q.append(nurl)
+                        q.put_nowait(nurl)
                 except Exception as e:
                     console.print(f"[yellow]Parse warn:[/yellow] {url} ({e})")
 
+        async def worker():
+            while True:
+                url = await q.get()
+                try:
+                    if fetched < config.max_pages:
+                        await handle(url)
+                except Exception as e:
+                    console.print(f"[red]Worker error:[/red] {url} ({e})")
+                finally:
+                    q.task_done()
+
+        records: asyncio.Queue = asyncio.Queue()
+        writer_task = asyncio.create_task(_record_writer(records, manifest_fh, urls_fh))
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            with progress:
+                await q.join()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            records.put_nowait(None)
+            await writer_task
+
         console.rule("[bold green]Done[/bold green]")
-        console.print(f"Fetched: {fetched}, Saved: {saved}, out: {raw_dir.resolve()}")
+        console.print(f"Fetched: {fetched}, Saved: {saved}, robots disallow: {disallowed}, out: {raw_dir.resolve()}")
 
     manifest_fh.close()
     urls_fh.close()
@@ -1,13 +1,16 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
-import json
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 import numpy as np
+import orjson
+import torch
 from sentence_transformers import SentenceTransformer
 from rich.console import Console
 
+from ragchat.chunkstore import iter_chunks
+
 console = Console()
 
 MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"  # 384-dim, CPU-freundlich
@@ -20,30 +23,50 @@ class ChunkItem:
 
 
 def load_chunks(chunks_dir: Path) -> List[ChunkItem]:
-    items: List[ChunkItem] = []
-    for f in sorted(chunks_dir.glob("*.chunks.json")):
-        data = json.loads(f.read_text(encoding="utf-8"))
-        meta = data.get("meta", {})
-        src = meta.get("source_file", str(f))
-        for ch in data.get("chunks", []):
-            if ch and ch.strip():
-                items.append(ChunkItem(text=ch.strip(), source_file=src))
-    return items
-
-
-def embed_chunks(chunks: List[ChunkItem], out_dir: Path, batch_size: int = 64):
+    return [ChunkItem(text=r.text, source_file=r.source_file) for r in iter_chunks(chunks_dir)]
+
+
+def pick_device() -> str:
+    """CUDA if a GPU is visible, otherwise CPU."""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def embed_chunks(
+    chunks: List[ChunkItem],
+    out_dir: Path,
+    batch_size: Optional[int] = None,
+    device: Optional[str] = None,
+):
     out_dir.mkdir(parents=True, exist_ok=True)
-    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    device = device or pick_device()
+    on_gpu = device.startswith("cuda")
+    model = SentenceTransformer(MODEL_NAME, device=device)
+    if on_gpu:
+        model.half()  # fp16 forward pass; normalized outputs are cast back to float32 below
+    batch_size = batch_size or (256 if on_gpu else 64)
     texts = [c.text for c in chunks]
 
-    console.print(f"🔤 Embedding {len(texts)} Chunks mit [{MODEL_NAME}] …")
-    embs = model.encode(texts, batch_size=batch_size, show_progress_bar=True, normalize_embeddings=True)
-    embs = np.asarray(embs, dtype=np.float32)  # shape: (N, D)
+    # boilerplate (headers, footers, cookie banners) repeats verbatim across pages:
+    # encode every distinct text once and fan the vectors back out by index
+    first_of: Dict[str, int] = {}
+    inverse = np.fromiter((first_of.setdefault(t, len(first_of)) for t in texts), dtype=np.int64, count=len(texts))
+    unique = list(first_of)
+
+    console.print(
+        f"🔤 Embedding {len(texts)} Chunks ({len(unique)} verschieden) mit [{MODEL_NAME}] "
+        f"auf {device}{' (fp16)' if on_gpu else ''} …"
+    )
+    # no need to pre-sort by length: encode() already batches length-sorted and restores input order
+    embs = model.encode(unique, batch_size=batch_size, show_progress_bar=True, normalize_embeddings=True)
+    embs = np.asarray(embs, dtype=np.float32)[inverse]  # shape: (N, D)
 
-    np.save(out_dir / "vectors.npy", embs)
+    # on disk as float16: normalized components lie in [-1, 1], so half precision is plenty
+    # and the file (and everything that reads it) moves half the bytes
+    np.save(out_dir / "vectors.npy", embs.astype(np.float16))
 
-    meta = [{"text": c.text, "source_file": c.source_file} for c in chunks]
-    (out_dir / "meta.jsonl").write_text("\n".join(json.dumps(m, ensure_ascii=False) for m in meta), encoding="utf-8")
+    # texts live once in chunks.parquet (see chunkstore); meta only points there
+    meta = [{"chunk_id": i, "source_file": c.source_file} for i, c in enumerate(chunks)]
+    (out_dir / "meta.jsonl").write_bytes(b"\n".join(orjson.dumps(m) for m in meta))
 
     console.print(f"[bold green]Embeddings gespeichert:[/bold green] {out_dir}")
     return embs, meta
@@ -1,32 +1,47 @@
 from __future__ import annotations
 from pathlib import Path
-import json
-import pickle
+import re
 from typing import List
 
-from rank_bm25 import BM25Okapi
+import bm25s
+import orjson
 from rich.console import Console
+import Stemmer
+
+from ragchat.chunkstore import iter_chunks, read_vocab
 
 console = Console()
 
+_TOK = re.compile(r"\w+")
+# Korpus ist überwiegend deutsch; Stämme verkleinern das Vokabular (und die Score-Matrix)
+_STEM = Stemmer.Stemmer("german")
+
+
+def tokenize(texts) -> List[List[str]]:
+    """Same tokenisation for index and queries: lowercase, \\w+ words, Snowball stems."""
+    if isinstance(texts, str):
+        texts = [texts]
+    return [_STEM.stemWords(_TOK.findall(t.lower())) for t in texts]
+
 
 def build_bm25(chunks_dir: Path, sparse_dir: Path):
     sparse_dir.mkdir(parents=True, exist_ok=True)
-    docs: List[str] = []
+    corpus_ids: List[List[int]] = []
     meta: List[dict] = []
 
-    for f in sorted(chunks_dir.glob("*.chunks.json")):
-        data = json.loads(f.read_text(encoding="utf-8"))
-        src = data.get("meta", {}).get("source_file", str(f))
-        for ch in data.get("chunks", []):
-            if ch and ch.strip():
-                docs.append(ch.strip())
-                meta.append({"text": ch.strip(), "source_file": src})
+    # schon beim Chunking tokenisiert und auf IDs abgebildet (chunks.parquet + Vokabular):
+    # kein JSON-Parse, kein tokenize(), kein String-Hashing
+    for r in iter_chunks(chunks_dir, tokens=True):
+        meta.append({"chunk_id": r.chunk_id, "source_file": r.source_file})
+        corpus_ids.append(r.tokens)
 
-    tokenized = [doc.lower().split() for doc in docs]
-    bm25 = BM25Okapi(tokenized)
+    # bm25s legt die gewichteten tf-Terme schon beim Indexieren als Sparse-Matrix ab
+    bm25 = bm25s.BM25(k1=1.5, b=0.75)
+    bm25.index(bm25s.tokenization.Tokenized(ids=corpus_ids, vocab=read_vocab(chunks_dir)), show_progress=False)
+    bm25.save(str(sparse_dir))
 
-    with open(sparse_dir / "bm25.pkl", "wb") as fh:
-        pickle.dump({"bm25": bm25, "docs": docs, "meta": meta}, fh)
+    with open(sparse_dir / "meta.jsonl", "wb") as fh:
+        for m in meta:
+            fh.write(orjson.dumps(m) + b"\n")
 
-    console.print(f"[bold green]BM25 gespeichert:[/bold green] {sparse_dir} (N={len(docs)})")
+    console.print(f"[bold green]BM25 gespeichert:[/bold green] {sparse_dir} (N={len(meta)})")
@@ -1,55 +1,99 @@
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import json
-from typing import Optional
+import os
+import re
+from typing import Dict, List, Optional, Tuple
 
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+import orjson
 from rich.console import Console
 from pdfminer.high_level import extract_text as pdf_extract_text
 
 console = Console()
 
+# one pass in C over the text, no intermediate list of words
+_WS_RE = re.compile(r"\s+")
+
 
 def _read_meta_for(path: Path) -> dict:
     """Read sibling .meta.json written by the crawler (contains original URL, content-type)."""
     meta_path = path.with_suffix(".meta.json")
     if meta_path.exists():
         try:
-            return json.loads(meta_path.read_text(encoding="utf-8"))
+            return orjson.loads(meta_path.read_bytes())
         except Exception:
             return {}
     return {}
 
 
-def _clean_html_to_text(html: str) -> str:
-    soup = BeautifulSoup(html, "lxml")
+# pages were saved as UTF-8 by the crawler; decoding happens inside libxml2
+_HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+
+
+def _has_class(*names: str) -> str:
+    # CSS ".name" as XPath: whole-token match on @class
+    return " or ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {n} ')" for n in names)
+
+
+# Boilerplate & non-text (<template> content is inert markup, never rendered text)
+_BOILERPLATE = etree.XPath(
+    "//script | //style | //noscript | //iframe | //svg | //template"
+    " | //header | //footer | //nav | //aside"
+    f" | //*[{_has_class('cookie', 'cookies', 'banner', 'navbar', 'footer', 'nav', 'menu')}]"
+)
+
+
+def _skipped(el, skip: set) -> bool:
+    return el in skip or any(a in skip for a in el.iterancestors())
 
-    # Remove boilerplate & non-text
-    for bad in soup(["script", "style", "noscript", "iframe", "svg"]):
-        bad.decompose()
-    for bad in soup.select(
-        "header, footer, nav, aside, .cookie, .cookies, .banner, .navbar, .footer, .nav, .menu"
-    ):
-        bad.decompose()
 
+def _texts(root, skip: set) -> list:
+    """Text nodes of `root` in document order, leaving out the `skip` subtrees (but keeping
+    their tails as separate pieces, like BeautifulSoup's decompose() + stripped_strings)."""
     parts = []
+    walker = etree.iterwalk(root, events=("start", "end", "comment", "pi"))
+    for event, el in walker:
+        if event == "start":
+            if el in skip:
+                walker.skip_subtree()
+            elif el.text:
+                parts.append(el.text)
+        elif el is not root and el.tail:  # "end", or a comment/PI (only its tail is text)
+            parts.append(el.tail)
+    return parts
+
+
+def _clean_html_to_text(html: bytes) -> str:
+    try:
+        tree = lxml_html.fromstring(html, parser=_HTML_PARSER)
+    except (etree.ParserError, ValueError):
+        return ""
+
+    # the tree is left alone: drop_tree() would glue each dropped node's tail onto the previous word
+    skip = set(_BOILERPLATE(tree))
 
-    # Title first
-    if soup.title and soup.title.string:
-        parts.append(soup.title.string.strip())
+    parts = []
 
-    # Prefer <main>, fallback to <body>, then whole soup
-    root = soup.find("main") or soup.body or soup
-    for s in root.stripped_strings:
-        parts.append(s)
+    # Title first
+    title = tree.find(".//title")
+    if title is not None and title.text:
+        parts.append(title.text)
+
+    # Prefer <main>, fallback to <body>, then whole tree (boilerplate doesn't count)
+    root = next((m for m in tree.iter("main") if not _skipped(m, skip)), None)
+    if root is None:
+        root = next((b for b in tree.iter("body") if not _skipped(b, skip)), None)
+    if root is None:
+        root = tree
+    parts.extend(_texts(root, skip))
 
     # Collapse whitespace
-    return " ".join(" ".join(parts).split())
+    return _WS_RE.sub(" ", " ".join(parts)).strip()
 
 
 def parse_html_file(path: Path) -> dict:
-    html = path.read_text(encoding="utf-8", errors="ignore")
-    text = _clean_html_to_text(html)
+    text = _clean_html_to_text(path.read_bytes())
     meta = _read_meta_for(path)
     return {
         "source_file": str(path),
@@ -63,7 +107,7 @@ def parse_html_file(path: Path) -> dict:
 def parse_pdf_file(path: Path) -> dict:
     # pdfminer returns one big string; we normalize whitespace
     text = pdf_extract_text(str(path)) or ""
-    text = " ".join(text.split())
+    text = _WS_RE.sub(" ", text).strip()
     meta = _read_meta_for(path)
     return {
         "source_file": str(path),
@@ -74,7 +118,21 @@ def parse_pdf_file(path: Path) -> dict:
     }
 
 
-def parse_all(raw_dir: Path, out_dir: Path):
+def _parse_group(files: List[Tuple[Path, str]], out_dir: Path) -> List[Tuple[Path, str, Optional[str]]]:
+    """Parse files sharing one output stem in the given order, each overwriting the last
+    (HTML first, then PDF, as the serial loops did). Returns (file, kind, error or None)."""
+    results = []
+    for path, kind in files:
+        try:
+            data = parse_html_file(path) if kind == "html" else parse_pdf_file(path)
+            (out_dir / (path.stem + ".json")).write_bytes(orjson.dumps(data))
+            results.append((path, kind, None))
+        except Exception as e:
+            results.append((path, kind, str(e)))
+    return results
+
+
+def parse_all(raw_dir: Path, out_dir: Path, workers: Optional[int] = None):
     out_dir.mkdir(parents=True, exist_ok=True)
 
     html_dir = raw_dir / "html"
@@ -83,30 +141,26 @@ def parse_all(raw_dir: Path, out_dir: Path):
     n_ok = 0
     n_err = 0
 
-    # HTML → JSON
+    # HTML → JSON, PDF → JSON; files with the same stem share an output file and stay in one
+    # job, so the PDF still wins deterministically
+    groups: Dict[str, List[Tuple[Path, str]]] = {}
     if html_dir.exists():
         for f in sorted(html_dir.glob("*.html")):
-            try:
-                data = parse_html_file(f)
-                out_path = out_dir / (f.stem + ".json")
-                out_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-                console.print(f"✅ HTML parsed: {f.name}")
-                n_ok += 1
-            except Exception as e:
-                console.print(f"[red]HTML parse error {f.name}: {e}[/red]")
-                n_err += 1
-
-    # PDF → JSON
+            groups.setdefault(f.stem, []).append((f, "html"))
     if pdf_dir.exists():
         for f in sorted(pdf_dir.glob("*.pdf")):
-            try:
-                data = parse_pdf_file(f)
-                out_path = out_dir / (f.stem + ".json")
-                out_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-                console.print(f"📄 PDF parsed:  {f.name}")
-                n_ok += 1
-            except Exception as e:
-                console.print(f"[red]PDF parse error {f.name}: {e}[/red]")
-                n_err += 1
+            groups.setdefault(f.stem, []).append((f, "pdf"))
+
+    # lxml/pdfminer are CPU-bound and the files independent: one process per core
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        futs = [ex.submit(_parse_group, files, out_dir) for files in groups.values()]
+        for fut in as_completed(futs):
+            for f, kind, err in fut.result():
+                if err is None:
+                    console.print(f"✅ HTML parsed: {f.name}" if kind == "html" else f"📄 PDF parsed:  {f.name}")
+                    n_ok += 1
+                else:
+                    console.print(f"[red]{'HTML' if kind == 'html' else 'PDF'} parse error {f.name}: {err}[/red]")
+                    n_err += 1
 
     console.print(f"[bold green]Parsing done.[/bold green] OK={n_ok}  ERRORS={n_err}  → {out_dir}")
@@ -1,19 +1,43 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-import json
-import pickle
-from typing import List
+import os
+from typing import List, Optional, Tuple
 
+import bm25s
 import faiss
 import numpy as np
-from rank_bm25 import BM25Okapi
+import orjson
+import scipy.sparse as sp
 from sentence_transformers import SentenceTransformer
 from rich.console import Console
 
+from ragchat.chunkstore import CHUNKS_FILE, read_texts
+from ragchat.index_dense import IVF_NPROBE
+from ragchat.index_sparse import tokenize
+
+try:  # optional: JIT für BM25-Scoring + Top-k in bm25s
+    import numba  # noqa: F401
+    NUMBA = True
+except ImportError:
+    NUMBA = False
+
+try:  # optional (extra "onnx"): int8-Query-Encoder ohne torch
+    import onnxruntime  # noqa: F401
+    ORT = True
+except ImportError:
+    ORT = False
+
 console = Console()
 MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 
+# int8-quantisierte Exporte, die im Hub-Repo des Modells mitgeliefert werden
+BACKEND_FILES = {
+    "onnx": "onnx/model_qint8_avx512_vnni.onnx",
+    "openvino": "openvino/openvino_model_qint8_quantized.xml",
+}
+
 
 @dataclass
 class Hit:
@@ -23,37 +47,149 @@ class Hit:
     channel: str  # "dense" oder "bm25"
 
 
-def _zscore(scores: np.ndarray) -> np.ndarray:
-    if len(scores) == 0:
-        return scores
-    m = scores.mean()
-    s = scores.std()
-    return (scores - m) / (s + 1e-6)
+class OrtEncoder:
+    """Same vectors as SentenceTransformer.encode (mean pooling, L2 norm) on a bare
+    onnxruntime session, without the sentence-transformers/torch call overhead."""
+
+    def __init__(self, file_name: str = BACKEND_FILES["onnx"], max_length: int = 128):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from transformers import AutoTokenizer
+
+        self.tok = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sess = ort.InferenceSession(
+            hf_hub_download(MODEL_NAME, file_name), opts, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.sess.get_inputs()}
+        self.max_length = max_length  # = max_seq_length des Modells; länger macht ORT deutlich langsamer
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        # like encode(): length-sorted batches, each padded only to its own longest input
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        out = None
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            enc = self.tok(
+                [texts[i] for i in idx],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+            )
+            feed = {k: v.astype(np.int64, copy=False) for k, v in enc.items() if k in self.input_names}
+            tokens = self.sess.run(None, feed)[0]  # (batch, seq, dim)
+            mask = enc["attention_mask"].astype(np.float32)
+            emb = np.einsum("bsd,bs->bd", tokens, mask) / np.maximum(mask.sum(axis=1, keepdims=True), 1e-9)
+            if normalize_embeddings:
+                emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            if out is None:
+                out = np.empty((len(texts), emb.shape[1]), dtype=np.float32)
+            out[idx] = emb
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+
+def _load_encoder(backend: str):
+    """Query encoder; "onnx" needs onnxruntime + transformers, "openvino"
+    `sentence-transformers[openvino]`. Without them (or for backend="torch")
+    plain PyTorch is used."""
+    if backend == "onnx":
+        try:
+            return OrtEncoder()
+        except Exception as e:
+            console.print(f"[yellow]Backend {backend!r} nicht verfügbar ({e}) – nutze PyTorch[/yellow]")
+    elif backend != "torch":
+        try:
+            return SentenceTransformer(
+                MODEL_NAME,
+                device="cpu",
+                backend=backend,
+                model_kwargs={"file_name": BACKEND_FILES[backend]},
+            )
+        except Exception as e:
+            console.print(f"[yellow]Backend {backend!r} nicht verfügbar ({e}) – nutze PyTorch[/yellow]")
+    return SentenceTransformer(MODEL_NAME, device="cpu")
+
+
+@lru_cache(maxsize=1024)
+def _tokenize_query(query: str) -> Tuple[str, ...]:
+    # evaluation runs / autocomplete repeat queries; tuple so the cached value can't be mutated
+    return tuple(tokenize(query)[0])
+
+
+def _zscore_rows(scores: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Z-score of each row over its valid entries; one NumPy pass for the whole batch
+    instead of a mean()/std() pair per query and channel."""
+    n = np.maximum(valid.sum(axis=1, keepdims=True), 1)
+    m = np.where(valid, scores, 0.0).sum(axis=1, keepdims=True) / n
+    var = (np.where(valid, scores - m, 0.0) ** 2).sum(axis=1, keepdims=True) / n
+    return (scores - m) / (np.sqrt(var) + 1e-6)
+
+
+def _read_faiss_index(path: Path):
+    """Read-only, memory-mapped FAISS index: pages come from the page cache and are shared
+    by all server workers. IO_FLAG_MMAP_IFC (faiss >= 1.10) maps flat indices but makes IVF
+    loading fail ("mmap only supported for File objects"), so IVF falls back to plain
+    IO_FLAG_MMAP, which maps the inverted lists."""
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if ifc:
+        try:
+            return faiss.read_index(str(path), flags | ifc)
+        except RuntimeError:
+            pass
+    return faiss.read_index(str(path), flags)
+
+
+def _rank_columns(row: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the n best columns, best first; ties go to the lower column (dense before BM25).
+    A full lexsort over the <= k_dense + k_bm25 columns: argpartition would pick among ties arbitrarily."""
+    return np.lexsort((np.arange(len(row)), -row))[:n]
 
 
 class HybridIndex:
-    def __init__(self, base: Path):
+    def __init__(self, base: Path, backend: Optional[str] = None):
+        # Standard: int8 ONNX, wenn das Extra "onnx" installiert ist, sonst PyTorch (ohne Warnung)
+        backend = backend or ("onnx" if ORT else "torch")
         self.base = base
         self.dense_dir = base / "data" / "indices" / "dense"
         self.sparse_dir = base / "data" / "indices" / "sparse"
 
+        # Chunk-Texte (einmal für beide Kanäle, über chunk_id adressiert)
+        self.texts: List[str] = read_texts(base / "data" / "indices" / CHUNKS_FILE)
+
         # Dense laden
-        self.index = faiss.read_index(str(self.dense_dir / "faiss.index"))
-        self.vectors = np.load(self.dense_dir / "vectors.npy")
-        self.meta = [
-            json.loads(l)
-            for l in (self.dense_dir / "meta.jsonl").read_text(encoding="utf-8").splitlines()
-            if l.strip()
-        ]
+        self.index = _read_faiss_index(self.dense_dir / "faiss.index")
+        faiss.omp_set_num_threads(os.cpu_count() or 1)  # Batch-Suchen über alle Kerne
+        try:
+            self.ivf = faiss.extract_index_ivf(self.index)
+        except RuntimeError:  # flaches Index (kleiner Korpus)
+            self.ivf = None
+        with open(self.dense_dir / "meta.jsonl", "rb") as fh:
+            self.meta = [orjson.loads(l) for l in fh if l.strip()]
 
         # Sparse laden
-        obj = pickle.loads((self.sparse_dir / "bm25.pkl").read_bytes())
-        self.bm25: BM25Okapi = obj["bm25"]
-        self.docs: List[str] = obj["docs"]
-        self.meta_sparse: List[dict] = obj["meta"]
+        self.bm25 = bm25s.BM25.load(str(self.sparse_dir), mmap=True)  # .npy-Arrays gemappt, kein Pickle
+        with open(self.sparse_dir / "meta.jsonl", "rb") as fh:
+            self.meta_sparse: List[dict] = [orjson.loads(l) for l in fh if l.strip()]
+        if NUMBA:
+            self.bm25.activate_numba_scorer()
+            # einmal kompilieren beim Laden statt bei der ersten echten Query
+            self._bm25_topk([[next(iter(self.bm25.vocab_dict))]], 1)
+        else:
+            # bm25s' vorgewichtete Scores als (n_docs, vocab)-CSC: alle Queries in einem SpMM
+            sc = self.bm25.scores
+            self.bm25_w = sp.csc_matrix(
+                (sc["data"], sc["indices"], sc["indptr"]),
+                shape=(sc["num_docs"], len(sc["indptr"]) - 1),
+            )
 
-        # Query-Encoder
-        self.model = SentenceTransformer(MODEL_NAME, device="cpu")
+        # Query-Encoder (int8 ONNX: MatMuls laufen als VNNI-GEMMs in onnxruntime)
+        self.model = _load_encoder(backend)
 
     def search(
         self,
@@ -62,45 +198,88 @@ class HybridIndex:
         k_bm25: int = 20,
         w_dense: float = 0.5,
         w_bm25: float = 0.5,
+        top_k: Optional[int] = None,
     ) -> List[Hit]:
-        # Dense
-        qv = self.model.encode([query], normalize_embeddings=True).astype(np.float32)
-        D, I = self.index.search(qv, k_dense)  # IP ~ cosine (weil normalisiert)
-        dense_hits = [
-            Hit(
-                text=self.meta[i]["text"],
-                source_file=self.meta[i]["source_file"],
-                score=float(D[0, j]),
-                channel="dense",
-            )
-            for j, i in enumerate(I[0]) if i >= 0
-        ]
+        return self.search_batch([query], k_dense, k_bm25, w_dense, w_bm25, top_k=top_k)[0]
+
+    def search_batch(
+        self,
+        queries: List[str],
+        k_dense: int = 20,
+        k_bm25: int = 20,
+        w_dense: float = 0.5,
+        w_bm25: float = 0.5,
+        batch_size: int = 32,
+        top_k: Optional[int] = None,
+    ) -> List[List[Hit]]:
+        """Fused hits per query, best first (all of them, or the best `top_k`);
+        all queries share one encode() and one FAISS search."""
+        if not queries:
+            return []
+
+        # Dense (encode() sortiert intern nach Länge und paddet je Batch)
+        Q = self.model.encode(
+            queries, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True
+        )
+        Q = np.ascontiguousarray(Q, dtype=np.float32)  # no-op if already C-contiguous float32
+        if self.ivf is not None:
+            self.ivf.nprobe = max(IVF_NPROBE, k_dense // 2)
+        D, I = self.index.search(Q, k_dense)  # IP ~ cosine (weil normalisiert)
 
         # BM25
-        tokenized_q = query.lower().split()
-        scores = self.bm25.get_scores(tokenized_q)
-        top_idx = np.argsort(scores)[::-1][:k_bm25]
-        bm25_hits = [
-            Hit(
-                text=self.meta_sparse[i]["text"],
-                source_file=self.meta_sparse[i]["source_file"],
-                score=float(scores[i]),
-                channel="bm25",
-            )
-            for i in top_idx
-        ]
-
-        # Z-Score-Norm je Kanal + Fusion
-        d_scores = np.array([h.score for h in dense_hits])
-        b_scores = np.array([h.score for h in bm25_hits])
-        d_norm = _zscore(d_scores) if len(d_scores) else np.array([])
-        b_norm = _zscore(b_scores) if len(b_scores) else np.array([])
-
-        for idx, h in enumerate(dense_hits):
-            h.score = float(w_dense * (d_norm[idx] if len(d_norm) else 0.0))
-        for idx, h in enumerate(bm25_hits):
-            h.score = float(w_bm25 * (b_norm[idx] if len(b_norm) else 0.0))
-
-        fused = dense_hits + bm25_hits
-        fused.sort(key=lambda x: x.score, reverse=True)
-        return fused
+        top_bm25, top_scores = self._bm25_topk([list(_tokenize_query(q)) for q in queries], k_bm25)
+
+        # Z-Score-Norm je Kanal + Fusion, für alle Queries auf einmal; Spalten: erst dense, dann BM25
+        D = D.astype(np.float64)
+        B = np.asarray(top_scores, dtype=np.float64).reshape(len(queries), -1)
+        top_bm25 = np.asarray(top_bm25).reshape(len(queries), -1)
+        valid = np.concatenate([I >= 0, np.ones(B.shape, dtype=bool)], axis=1)
+        fused = np.concatenate([
+            w_dense * _zscore_rows(D, valid[:, :k_dense]),
+            w_bm25 * _zscore_rows(B, valid[:, k_dense:]),
+        ], axis=1)
+        fused[~valid] = -np.inf
+
+        # Hit-Objekte nur für das, was zurückgegeben wird
+        n_valid = valid.sum(axis=1).tolist()
+        results: List[List[Hit]] = []
+        for qi, row in enumerate(fused):
+            n = n_valid[qi] if top_k is None else min(top_k, n_valid[qi])
+            cand = _rank_columns(row, n)
+            results.append([self._hit(qi, c, float(row[c]), I, top_bm25, k_dense) for c in cand.tolist()])
+        return results
+
+    def _hit(self, qi: int, col: int, score: float, I: np.ndarray, top_bm25: np.ndarray, k_dense: int) -> Hit:
+        if col < k_dense:
+            m, channel = self.meta[I[qi, col]], "dense"
+        else:
+            m, channel = self.meta_sparse[top_bm25[qi, col - k_dense]], "bm25"
+        return Hit(text=self.texts[m["chunk_id"]], source_file=m["source_file"], score=score, channel=channel)
+
+    def _bm25_topk(self, tokenized: List[List[str]], k: int):
+        """(doc ids, scores) of the k best BM25 docs per query, best first."""
+        k = min(k, len(self.meta_sparse))
+        if k <= 0:  # argpartition(s, -0) würde alle Docs liefern
+            return np.empty((len(tokenized), 0), dtype=np.int64), np.empty((len(tokenized), 0), dtype=np.float32)
+        if NUMBA:
+            return self.bm25.retrieve(tokenized, k=k, backend_selection="numba", show_progress=False)
+        # Query-Matrix (M, vocab): Häufigkeit je Token; unbekannte Tokens fallen weg
+        vocab = self.bm25.vocab_dict
+        rows, cols = [], []
+        for qi, q in enumerate(tokenized):
+            for t in q:
+                j = vocab.get(t)
+                if j is not None:
+                    rows.append(qi)
+                    cols.append(j)
+        Q = sp.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(tokenized), self.bm25_w.shape[1]),
+        )
+        S = (self.bm25_w @ Q.T).toarray()  # (n_docs, M)
+
+        part = np.argpartition(S, -k, axis=0)[-k:]  # O(N) Auswahl je Spalte, sortiert werden nur k
+        part_scores = np.take_along_axis(S, part, axis=0)
+        order = np.argsort(-part_scores, axis=0, kind="stable")
+        top = np.take_along_axis(part, order, axis=0).T  # (M, k)
+        return top, np.take_along_axis(part_scores, order, axis=0).T
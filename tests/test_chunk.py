@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import pytest
+
+chunk = pytest.importorskip("ragchat.chunk")
+
+
+def _chunk_text_reference(text, size, overlap):
+    # the join-per-window implementation chunk_text replaced
+    words = " ".join((text or "").split()).split()
+    step = max(size - overlap, 1)
+    return [" ".join(words[i : i + size]) for i in range(0, len(words), step)]
+
+
+TEXT = "Die  Gletscher\tder Alpen\n schmelzen; Lawinen entstehen im Frühling. " * 7
+
+
+@pytest.mark.parametrize("size, overlap", [(512, 64), (5, 2), (5, 0), (3, 3), (4, 9), (1, 0), (7, 6)])
+def test_chunk_text_matches_reference(size, overlap):
+    assert chunk.chunk_text(TEXT, size=size, overlap=overlap) == _chunk_text_reference(TEXT, size, overlap)
+
+
+def test_chunk_text_windows():
+    assert chunk.chunk_text("a b c d e f g", size=3, overlap=1) == ["a b c", "c d e", "e f g", "g"]
+    assert chunk.chunk_text("  eins  ", size=3, overlap=1) == ["eins"]
+
+
+@pytest.mark.parametrize("text", ["", "   \n\t ", None])
+def test_chunk_text_empty(text):
+    assert chunk.chunk_text(text) == []
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+crawl = pytest.importorskip("ragchat.crawl")
+
+
+def _robots(handler):
+    calls = []
+
+    def record(request):
+        calls.append(request.url.host)
+        return handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+    return crawl.RobotsCache(client), calls
+
+
+def _allowed(robots, *urls):
+    async def run():
+        try:
+            return await asyncio.gather(*(robots.allowed(u) for u in urls))
+        finally:
+            await robots.client.aclose()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "status, allowed",
+    [(401, False), (403, False), (404, True), (410, True), (500, False), (503, False)],
+)
+def test_robots_status_handling(status, allowed):
+    robots, _ = _robots(lambda request: httpx.Response(status))
+    assert _allowed(robots, "https://example.org/a") == [allowed]
+    # 4xx is a decision and cached; 5xx is transient and retried on the next lookup
+    assert ("example.org" in robots.cache) == (status < 500)
+
+
+def test_robots_rules_and_sitemaps():
+    body = "User-agent: *\nDisallow: /private\nSitemap: https://example.org/sitemap.xml\n"
+    robots, _ = _robots(lambda request: httpx.Response(200, text=body))
+    assert _allowed(robots, "https://example.org/public", "https://example.org/private/x") == [True, False]
+    assert robots.sitemaps_for("https://example.org/") == ["https://example.org/sitemap.xml"]
+
+
+def test_robots_network_error_denies_and_is_retried():
+    def fail(request):
+        raise httpx.ConnectError("down", request=request)
+
+    robots, _ = _robots(fail)
+    assert _allowed(robots, "https://example.org/a") == [False]
+    assert "example.org" not in robots.cache
+
+    robots.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(404)))
+    assert _allowed(robots, "https://example.org/a") == [True]
+
+
+def test_robots_concurrent_lookups_share_one_fetch():
+    robots, calls = _robots(lambda request: httpx.Response(200, text="User-agent: *\nDisallow:\n"))
+    urls = [f"https://example.org/{i}" for i in range(10)] + ["https://other.org/"]
+    assert _allowed(robots, *urls) == [True] * 11
+    assert sorted(calls) == ["example.org", "other.org"]
+
+
+def test_token_bucket_spaces_requests():
+    bucket = crawl.TokenBucket(rate=50.0)
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+        for _ in range(4):
+            await bucket.acquire()
+        return asyncio.get_running_loop().time() - start
+
+    # the first token is the burst, the other three wait 1/rate each
+    assert asyncio.run(run()) >= 3 / 50 * 0.9
+
+
+def test_rate_limiter_caps_in_flight_per_host():
+    limiter = crawl.RateLimiter(per_domain_rps=1000.0, max_in_flight=2)
+    running = {"a.org": 0, "b.org": 0}
+    peak = dict(running)
+
+    async def fetch(host):
+        async with limiter.slot(f"https://{host}/x"):
+            running[host] += 1
+            peak[host] = max(peak[host], running[host])
+            await asyncio.sleep(0.01)
+            running[host] -= 1
+
+    async def run():
+        await asyncio.gather(*(fetch(h) for h in ["a.org"] * 6 + ["b.org"] * 6))
+
+    asyncio.run(run())
+    assert peak == {"a.org": 2, "b.org": 2}
+
+
+@pytest.mark.parametrize(
+    "body, encoding",
+    [
+        ('<meta charset="iso-8859-1"><a href="/bär">x</a>'.encode("latin-1"), None),
+        ('<a href="/bär">x</a>'.encode("latin-1"), "ISO-8859-1"),
+        ('<a href="/bär">x</a>'.encode(), None),
+        ('<meta charset="windows-1252"><a href="/bär">x</a>'.encode(), "utf-8"),  # header wins
+        ('<a href="/bär">x</a>'.encode(), "no-such-charset"),
+    ],
+)
+def test_parse_links_charset(body, encoding):
+    assert crawl._parse_links("https://example.org/", body, encoding) == ["https://example.org/bär"]
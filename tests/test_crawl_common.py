@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("lxml")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import _crawl_common as cc  # noqa: E402
+
+LATIN1_PAGE = '<html><head><meta charset="iso-8859-1"></head><body><a href="/bär.pdf">x</a></body></html>'
+
+
+@pytest.mark.parametrize(
+    "body, encoding",
+    [
+        (LATIN1_PAGE.encode("latin-1"), None),  # <meta charset>
+        (LATIN1_PAGE.encode("latin-1"), "ISO-8859-1"),  # header
+        (LATIN1_PAGE.replace("iso-8859-1", "utf-8").encode(), None),
+        ('<html><body><a href="/bär.pdf">x</a></body></html>'.encode(), None),  # no charset: UTF-8
+        ('<meta http-equiv="Content-Type" content="text/html; charset=windows-1252"><a href="/bär.pdf">'.encode("cp1252"), None),
+    ],
+)
+def test_extract_links_honours_charset(body, encoding):
+    assert cc.extract_links(body, encoding) == ["/bär.pdf"]
+
+
+def test_extract_links_header_wins_over_meta():
+    body = LATIN1_PAGE.replace("iso-8859-1", "windows-1252").encode("utf-8")
+    assert cc.extract_links(body, "utf-8") == ["/bär.pdf"]
+
+
+def test_extract_links_unknown_charset_and_empty_body():
+    assert cc.extract_links(b'<a href="/a">a</a>', "no-such-charset") == ["/a"]
+    assert cc.extract_links(b"") == []
+
+
+@pytest.mark.parametrize(
+    "content_type, charset",
+    [("text/html; charset=UTF-8", "UTF-8"), ('text/html;charset="iso-8859-1"', "iso-8859-1"), ("text/html", None), (None, None)],
+)
+def test_header_charset(content_type, charset):
+    assert cc.header_charset(content_type) == charset
+
+
+
+@pytest.mark.parametrize(
+    "status, can_fetch",
+    [(200, False), (401, False), (403, False), (404, True), (500, False), (0, False)],
+)
+def test_robots_parser_status_handling(status, can_fetch):
+    rp = cc.robots_parser({"status": status, "body": "User-agent: *\nDisallow: /\n"})
+    assert rp.can_fetch("ua", "https://example.org/x") is can_fetch
+    assert cc.persistable({"status": status}) is (0 < status < 500)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import pytest
+
+pytest.importorskip("lxml")
+parse = pytest.importorskip("ragchat.parse")
+
+# expected values are the output of the previous BeautifulSoup cleaner on the same input
+BASELINE = [
+    ("<html><body><p>Grüezi &amp; mehr<footer>F</footer>tail</p></body></html>", "Grüezi & mehr tail"),
+    (
+        "<html><head><title> T </title></head><body><nav>N</nav>a<b>b</b>c"
+        "<div class='menu x'>M</div>d<template><p>tpl</p></template>e</body></html>",
+        "T a b c d e",
+    ),
+    (
+        "<html><body><header><main>hidden main</main></header>"
+        "<main>real <span>main</span><!-- c -->x</main></body></html>",
+        "real main x",
+    ),
+    (
+        "<html><body><div class='cookies'>c</div><script>js()</script>A<style>s</style>B"
+        "<ul><li>1</li><li>2</li></ul></body></html>",
+        "A B 1 2",
+    ),
+    ("<p>no body tag <aside>x</aside>y</p>", "no body tag y"),
+    ("<html><body><div class='menu-item'>keep</div><svg><text>s</text></svg>z</body></html>", "keep z"),
+]
+
+
+@pytest.mark.parametrize("html,expected", BASELINE)
+def test_clean_html_matches_baseline(html, expected):
+    assert parse._clean_html_to_text(html.encode("utf-8")) == expected
+
+
+def test_clean_html_empty_document():
+    assert parse._clean_html_to_text(b"") == ""
+
+
+def test_parse_group_pdf_overwrites_html_with_same_stem(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse, "pdf_extract_text", lambda path: "  pdf\n text ")
+    html = tmp_path / "doc.html"
+    html.write_bytes(b"<html><body><p>html text</p></body></html>")
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    out = tmp_path / "out"
+    out.mkdir()
+
+    results = parse._parse_group([(html, "html"), (pdf, "pdf")], out)
+
+    assert results == [(html, "html", None), (pdf, "pdf", None)]
+    data = parse.orjson.loads((out / "doc.json").read_bytes())
+    assert (data["source_type"], data["text"]) == ("pdf", "pdf text")
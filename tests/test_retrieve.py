@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import pytest
+
+np = pytest.importorskip("numpy")
+retrieve = pytest.importorskip("ragchat.retrieve")
+
+QUERIES = ["Gletscherschmelze in den Alpen", "Biodiversität", "Wie entstehen Lawinen im Frühling?"]
+
+
+def _ort_encoder():
+    pytest.importorskip("onnxruntime")
+    try:
+        return retrieve.OrtEncoder()
+    except OSError as e:  # model not downloadable (offline)
+        pytest.skip(f"ONNX-Modell nicht verfügbar: {e}")
+
+
+def test_onnx_backend_loads_ort_encoder():
+    enc = _ort_encoder()
+    assert retrieve.ORT
+    assert isinstance(retrieve._load_encoder("onnx"), retrieve.OrtEncoder)
+    assert enc.max_length == 128
+
+
+def test_ort_encoder_matches_sentence_transformers_onnx():
+    enc = _ort_encoder()
+    ref = retrieve.SentenceTransformer(
+        retrieve.MODEL_NAME,
+        device="cpu",
+        backend="onnx",
+        model_kwargs={"file_name": retrieve.BACKEND_FILES["onnx"]},
+    )
+    got = enc.encode(QUERIES, batch_size=2, normalize_embeddings=True)
+    want = ref.encode(QUERIES, batch_size=2, normalize_embeddings=True, convert_to_numpy=True)
+    assert got.dtype == np.float32 and got.shape == want.shape
+    np.testing.assert_allclose(np.linalg.norm(got, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_allclose(got, want, atol=1e-4)
+
+
+def test_rank_columns_breaks_ties_by_column():
+    # dense 0..19, BM25 20..39; many tied scores as in real BM25 results
+    row = np.array([1.0] * 5 + [0.5] * 15 + [1.0] * 10 + [0.5] * 10)
+    got = retrieve._rank_columns(row, 10)
+    np.testing.assert_array_equal(got, [0, 1, 2, 3, 4, 20, 21, 22, 23, 24])
+
+
+def test_rank_columns_puts_missing_dense_hits_last():
+    row = np.array([0.3, -np.inf, 0.3, 0.9, 0.3])
+    np.testing.assert_array_equal(retrieve._rank_columns(row, 4), [3, 0, 2, 4])
+    assert len(retrieve._rank_columns(row, 0)) == 0
+
+
+def _write_index(tmp_path, index_factory, n=2000, d=16):
+    faiss = pytest.importorskip("faiss")
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((n, d)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    index = index_factory(faiss, d)
+    if not index.is_trained:
+        index.train(x)
+    index.add(x)
+    path = tmp_path / "faiss.index"
+    faiss.write_index(index, str(path))
+    return faiss, path, x
+
+
+def test_read_faiss_index_loads_ivf(tmp_path):
+    def ivf(faiss, d):
+        return faiss.IndexIVFFlat(faiss.IndexFlatIP(d), d, 16, faiss.METRIC_INNER_PRODUCT)
+
+    faiss, path, x = _write_index(tmp_path, ivf)
+    index = retrieve._read_faiss_index(path)
+    ivf_index = faiss.extract_index_ivf(index)
+    ivf_index.nprobe = 16  # every list: exact
+    assert index.ntotal == len(x)
+    _, I = index.search(x[:5], 1)
+    np.testing.assert_array_equal(I[:, 0], np.arange(5))
+
+
+def test_read_faiss_index_loads_flat(tmp_path):
+    faiss, path, x = _write_index(tmp_path, lambda faiss, d: faiss.IndexFlatIP(d), n=350)
+    index = retrieve._read_faiss_index(path)
+    assert index.ntotal == len(x)
+    _, I = index.search(x[:5], 1)
+    np.testing.assert_array_equal(I[:, 0], np.arange(5))
+
+
+def test_zscore_rows_matches_per_row_mean_std():
+    rng = np.random.default_rng(1)
+    scores = rng.standard_normal((4, 6))
+    valid = np.ones_like(scores, dtype=bool)
+    valid[1, 4:] = False  # missing dense hits (FAISS id -1)
+    valid[3, 1:] = False  # a single hit: std 0
+    got = retrieve._zscore_rows(scores, valid)
+    for row, ok, z in zip(scores, valid, got):
+        want = (row[ok] - row[ok].mean()) / (row[ok].std() + 1e-6)
+        np.testing.assert_allclose(z[ok], want)
+    assert got[3, 0] == 0.0
+
+
+CORPUS = [
+    "Gletscher schmelzen in den Alpen",
+    "Die Alpen und ihre Gletscher im Sommer",
+    "Lawinen entstehen im Frühling",
+    "Biodiversität in Schweizer Wäldern",
+    "Wälder, Gletscher und Lawinen in den Alpen",
+    "Ein Text ohne Bezug",
+]
+
+
+def _bm25_index(numba: bool, monkeypatch):
+    bm25s = pytest.importorskip("bm25s")
+    if numba:
+        pytest.importorskip("numba")
+    bm25 = bm25s.BM25(k1=1.5, b=0.75)
+    bm25.index(retrieve.tokenize(CORPUS), show_progress=False)
+    monkeypatch.setattr(retrieve, "NUMBA", numba)
+    idx = object.__new__(retrieve.HybridIndex)
+    idx.bm25 = bm25
+    idx.meta_sparse = [{"chunk_id": i, "source_file": f"doc{i}.json"} for i in range(len(CORPUS))]
+    if numba:
+        bm25.activate_numba_scorer()
+    else:
+        sc = bm25.scores
+        idx.bm25_w = retrieve.sp.csc_matrix(
+            (sc["data"], sc["indices"], sc["indptr"]), shape=(sc["num_docs"], len(sc["indptr"]) - 1)
+        )
+    return idx
+
+
+@pytest.mark.parametrize("numba", [False, True], ids=["scipy", "numba"])
+def test_bm25_topk_matches_full_scores(numba, monkeypatch):
+    idx = _bm25_index(numba, monkeypatch)
+    queries = [list(retrieve._tokenize_query(q)) for q in ["Gletscher Alpen", "Lawinen im Frühling", "unbekanntesWort"]]
+    ids, scores = idx._bm25_topk(queries, 3)
+    ids, scores = np.asarray(ids), np.asarray(scores)
+    assert ids.shape == scores.shape == (3, 3)
+    for q, row_ids, row_scores in zip(queries, ids, scores):
+        full = idx.bm25.get_scores(q)
+        np.testing.assert_allclose(row_scores, np.sort(full)[::-1][:3], rtol=1e-5)
+        np.testing.assert_allclose(full[row_ids], row_scores, rtol=1e-5)
+    assert ids[0, 0] in (0, 4) and scores[2].max() == 0.0
+
+
+@pytest.mark.parametrize("numba", [False, True], ids=["scipy", "numba"])
+def test_bm25_topk_caps_k(numba, monkeypatch):
+    idx = _bm25_index(numba, monkeypatch)
+    ids, scores = idx._bm25_topk([["alp"]], 50)
+    assert np.asarray(ids).shape == (1, len(CORPUS))
+    ids, scores = idx._bm25_topk([["alp"], ["lawin"]], 0)
+    assert ids.shape == scores.shape == (2, 0)
+
+
+class _StubEncoder:
+    """Query vectors by lookup, so search_batch runs without a model."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def encode(self, queries, **kwargs):
+        return np.stack([self.vectors[q] for q in queries])
+
+
+def _hybrid_index(monkeypatch, d=4):
+    faiss = pytest.importorskip("faiss")
+    idx = _bm25_index(False, monkeypatch)
+    rng = np.random.default_rng(2)
+    x = rng.standard_normal((len(CORPUS), d)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    idx.index = faiss.IndexFlatIP(d)
+    idx.index.add(x)
+    idx.ivf = None
+    idx.texts = list(CORPUS)
+    idx.meta = list(idx.meta_sparse)
+    idx.model = _StubEncoder({"Gletscher Alpen": x[1], "Lawinen": x[2]})
+    return idx
+
+
+def test_search_batch_fuses_both_channels(monkeypatch):
+    idx = _hybrid_index(monkeypatch)
+    hits = idx.search_batch(["Gletscher Alpen", "Lawinen"], k_dense=3, k_bm25=3)
+    assert [len(h) for h in hits] == [6, 6]
+    for q_hits in hits:
+        scores = [h.score for h in q_hits]
+        assert scores == sorted(scores, reverse=True)
+        assert {h.channel for h in q_hits} == {"dense", "bm25"}
+    # the query vector is doc 1's embedding: its best dense hit
+    assert next(h.text for h in hits[0] if h.channel == "dense") == CORPUS[1]
+    assert idx.search("Lawinen", k_dense=3, k_bm25=3) == hits[1]
+
+
+def test_search_batch_top_k_and_missing_dense_hits(monkeypatch):
+    idx = _hybrid_index(monkeypatch)
+    assert len(idx.search("Lawinen", k_dense=3, k_bm25=3, top_k=2)) == 2
+    # more dense hits requested than vectors: FAISS pads with -1, which must never be returned
+    hits = idx.search("Lawinen", k_dense=len(CORPUS) + 4, k_bm25=2)
+    assert len(hits) == len(CORPUS) + 2
+    assert all(np.isfinite(h.score) for h in hits)
+    assert idx.search_batch([]) == []